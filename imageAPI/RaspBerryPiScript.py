@@ -4,12 +4,20 @@ import subprocess
 import logging
 import datetime
 import time
-import base64
-import requests
+import functools
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import json
 import select  # Added for polling input
 from PIL import Image, ImageDraw, ImageFont
 from dotenv import load_dotenv
-import RPi.GPIO as GPIO
+
+# RPi.GPIO only exists on the Pi; the pipeline itself can be imported anywhere (benchmarks)
+try:
+    import RPi.GPIO as GPIO
+except ImportError:
+    GPIO = None
 
 # Configure logging
 logging.basicConfig(
@@ -26,64 +34,204 @@ BUTTON_CAPTURE = 20  # GPIO pin for capture button
 BUTTON_UP = 26       # GPIO pin for scroll up button
 BUTTON_DOWN = 21     # GPIO pin for scroll down button
 
-# GPIO setup
-GPIO.setmode(GPIO.BCM)
-GPIO.setup(BUTTON_CAPTURE, GPIO.IN, pull_up_down=GPIO.PUD_UP) # Using interior resistor
-GPIO.setup(BUTTON_UP, GPIO.IN, pull_up_down=GPIO.PUD_UP) # Using interior resistor
-GPIO.setup(BUTTON_DOWN, GPIO.IN, pull_up_down=GPIO.PUD_UP) # Using interior resistor
-
-# Import LCD module
-try:
-    from lib import LCD_1inch5
-    print("LCD imported")
-except ImportError as e:
-    print(f"LCD import error: {e}")
-    sys.exit(1)
-
-# Load environment variables from .env file
+# Load environment variables from .env file (before local modules read their settings)
 load_dotenv()
 
+import openrouter_client
+from image_derivatives import ImageDerivatives, load_derivatives
+import orientation
+from progressive_text import ProgressiveTextRenderer, stream_to_display
+import pipeline_metrics
+import result_cache
+import request_policy
+import hedging
+import model_router
+import camera
+import jpeg_rotation
+import frame_quality
+import upload_encoder
+import roi
+import capture_queue
+from capture_history import CaptureHistory
+
 # OpenRouter API key
 OPENAPI_KEY = os.getenv("OPENAPI_KEY")
 if not OPENAPI_KEY:
     logger.error("OPENAPI_KEY not found in environment variables")
     sys.exit(1)
 
+# Picks the model for each stage from rolling latency and error statistics
+router = model_router.ModelRouter()
+
+# Shared keep-alive connection pool for all OpenRouter calls
+api_client = openrouter_client.OpenRouterClient(OPENAPI_KEY, on_result=router.record,
+                                                on_upload=upload_encoder.upload_bandwidth.add)
+
+# Stream analysis and description tokens onto the LCD as they arrive
+STREAM_RESPONSES = os.getenv("STREAM_RESPONSES", "1") == "1"
+
+# "sequential" runs orientation before analysis, "speculative" runs them concurrently,
+# "fast" gets orientation, objects and the final summary from a single vision call
+PIPELINE_MODE = os.getenv("PIPELINE_MODE", "sequential")
+PIPELINE_MODES = ("sequential", "speculative", "fast")
+
+# Race slow analysis requests against a second model
+ANALYSIS_HEDGING = os.getenv("ANALYSIS_HEDGING", "0") == "1"
+HEDGE_SECONDARY_MODEL = os.getenv("HEDGE_SECONDARY_MODEL", "openai/gpt-4o-2024-08-06")
+analysis_hedge_stats = hedging.HedgeStats()
+
+# Analysis replies containing this marker depend on the image being upright
+ROTATION_SENSITIVE_MARKER = "ROTATION_SENSITIVE"
+
+# Multi-shot mode: presses within MULTI_SHOT_WINDOW seconds of each other are views of one subject,
+# described together with one analysis request (up to MULTI_SHOT_MAX images)
+MULTI_SHOT = os.getenv("MULTI_SHOT", "0") == "1"
+MULTI_SHOT_WINDOW = float(os.getenv("MULTI_SHOT_WINDOW", "4"))
+MULTI_SHOT_MAX = int(os.getenv("MULTI_SHOT_MAX", "4"))
+
+# Structured output returned by the single-call fast path
+FAST_PATH_SCHEMA = {
+    "name": "image_description",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "rotation": {
+                "type": "integer",
+                "enum": [0, 90, 180, 270],
+                "description": "Clockwise rotation in degrees needed to make the image upright"
+            },
+            "objects": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": "Main objects or items visible, excluding the background"
+            },
+            "summary": {
+                "type": "string",
+                "description": "Clear and short description of the main objects for a small display"
+            }
+        },
+        "required": ["rotation", "objects", "summary"],
+        "additionalProperties": False
+    }
+}
+
+# Capture output locations
+IMAGE_OUTPUT_DIR = os.getenv("IMAGE_OUTPUT_DIR", "/home/username/imageAPI/Pictures")
+
+# Captures stay in memory; the upright JPEG is only written to the SD card when kept with the history
+CAPTURE_HISTORY_IMAGES = os.getenv("CAPTURE_HISTORY_IMAGES", "0") == "1"
+HISTORY_IMAGE_DIR = os.path.join(IMAGE_OUTPUT_DIR, "history")
+
+# Camera backend: a warm picamera2 stream (or libcamera-still) on the Pi, stand-ins for benchmarks
+camera_backend = camera.create_camera()
+
+# Perceptual-hash cache of descriptions for repeat scans of the same product
+description_cache = None
+if result_cache.RESULT_CACHE_ENABLED:
+    try:
+        description_cache = result_cache.ResultCache(
+            os.getenv("RESULT_CACHE_PATH", os.path.join(IMAGE_OUTPUT_DIR, "result_cache.db")))
+    except Exception as e:
+        logger.error(f"Result cache disabled: {e}")
+
+# Descriptions of recent captures, browsable on the LCD with UP and DOWN pressed together
+capture_history = None
+try:
+    capture_history = CaptureHistory(
+        os.getenv("CAPTURE_HISTORY_PATH", os.path.join(IMAGE_OUTPUT_DIR, "history.jsonl")))
+except Exception as e:
+    logger.error(f"Capture history disabled: {e}")
+
+# Captures taken while offline wait here until the endpoint is reachable again
+offline_queue = None
+if capture_queue.CAPTURE_QUEUE_ENABLED:
+    try:
+        offline_queue = capture_queue.CaptureQueue(
+            os.getenv("CAPTURE_QUEUE_DIR", os.path.join(IMAGE_OUTPUT_DIR, "queue")))
+    except Exception as e:
+        logger.error(f"Offline capture queue disabled: {e}")
+
 # Global variables
 current_scroll_position = 0
 image_description = ""
 lcd_display = None
+queue_worker = None
+history_position = None  # Entry shown in the history view, None outside it
+pending_shots = []  # Multi-shot views waiting for the window to close
+last_shot_time = 0.0
+
+# Background work (the offline queue) sets muted so it never draws over the live screen
+lcd_output = threading.local()
+
+def setup_gpio():
+    """Configure the button pins"""
+    GPIO.setmode(GPIO.BCM)
+    GPIO.setup(BUTTON_CAPTURE, GPIO.IN, pull_up_down=GPIO.PUD_UP) # Using interior resistor
+    GPIO.setup(BUTTON_UP, GPIO.IN, pull_up_down=GPIO.PUD_UP) # Using interior resistor
+    GPIO.setup(BUTTON_DOWN, GPIO.IN, pull_up_down=GPIO.PUD_UP) # Using interior resistor
 
 def sanitize_text(text):
     """Remove characters that can't be encoded in Latin-1"""
     return ''.join(c for c in text if ord(c) < 256)
 
-def encode_image_to_base64(image_path):
-    """Encode image to base64 for API requests"""
-    try:
-        with open(image_path, "rb") as img_file:
-            return base64.b64encode(img_file.read()).decode("utf-8")
-    except Exception as e:
-        logger.error(f"Error encoding image: {str(e)}")
-        return None
-
-def detect_image_orientation(image_path):
+def render_stream_to_lcd(deltas, header="", label="response", start_time=None):
+    """Render streamed text deltas on the LCD as they arrive, returns the full text"""
+    # The rotation marker is for analyze_speculatively, not for the screen
+    renderer = ProgressiveTextRenderer(lambda text: display_text_on_lcd(header + text),
+                                       hidden_marker=ROTATION_SENSITIVE_MARKER)
+    text, first_text_time = stream_to_display(deltas, renderer, label, start_time)
+    if first_text_time is not None:
+        pipeline_metrics.record(f"{label}_first_text", first_text_time)
+    return sanitize_text(text)
+
+def stream_completion_to_lcd(data, header="", label="response", deadline=None):
+    """Stream a chat completion, rendering the partial text on the LCD as it grows"""
+    deltas = api_client.chat_completion_stream(data, on_usage=pipeline_metrics.add_usage, stage=label, deadline=deadline)
+    return render_stream_to_lcd(deltas, header, label)
+
+def hedged_analysis_request(data, deadline=None):
+    """Send the analysis request to the primary model, hedging to the secondary when it is slow"""
+    def send(model, cancel_event):
+        # The cancel event lets the hedge drop the loser's connection instead of letting it finish
+        response = api_client.chat_completion(dict(data, model=model), stage="analysis", deadline=deadline,
+                                              cancel_event=cancel_event)
+        if response.status_code != 200:
+            raise openrouter_client.OpenRouterError(response.status_code, response.text)
+        return response
+
+    _, response = hedging.hedged_call(data["model"], HEDGE_SECONDARY_MODEL, send, analysis_hedge_stats)
+    return response
+
+def hedged_analysis_stream(data, deadline=None):
+    """Open the analysis stream on the primary model, hedging to the secondary until one starts answering"""
+    def open_stream(model, cancel_event):
+        deltas = api_client.chat_completion_stream(dict(data, model=model), on_usage=pipeline_metrics.add_usage,
+                                                   stage="analysis", deadline=deadline, cancel_event=cancel_event)
+        first_delta = next(deltas, "")
+        if cancel_event.is_set():
+            # Lost the race, stop downloading
+            deltas.close()
+            return None
+        return first_delta, deltas
+
+    _, (first_delta, deltas) = hedging.hedged_call(data["model"], HEDGE_SECONDARY_MODEL, open_stream,
+                                                   analysis_hedge_stats, discard=lambda opened: opened[1].close())
+    return itertools.chain([first_delta], deltas)
+
+def detect_image_orientation(image_source, deadline=None):
     """Detect image orientation using ChatGPT"""
     try:
-        # Encode image to base64
-        encoded_image = encode_image_to_base64(image_path)
-        if not encoded_image:
+        model = router.select("orientation")
+        # Encode a small thumbnail, orientation does not need full resolution
+        image_url = load_derivatives(image_source).data_url("orientation", model_router.accepted_codecs(model))
+        if not image_url.base64_bytes:
             return 0  # Default to no rotation if encoding fails
 
-        # Prepare the request
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {OPENAPI_KEY}"
-        }
-
         # Use ChatGPT for orientation detection
         data = {
-            "model": "openai/gpt-4o-2024-08-06",
+            "model": model,
+            "provider": router.provider_preferences("orientation"),
             "messages": [
                 {
                     "role": "system",
@@ -99,7 +247,7 @@ def detect_image_orientation(image_path):
                         {
                             "type": "image_url",
                             "image_url": {
-                                "url": f"data:image/jpeg;base64,{encoded_image}"
+                                "url": image_url
                             }
                         }
                     ]
@@ -108,15 +256,12 @@ def detect_image_orientation(image_path):
             "temperature": 0
         }
 
-        # Make the API request
-        response = requests.post(
-            "https://openrouter.ai/api/v1/chat/completions",
-            headers=headers,
-            json=data
-        )
+        # Make the API request over the shared connection pool
+        response = api_client.chat_completion(data, stage="orientation", deadline=deadline)
 
         if response.status_code == 200:
             result = response.json()
+            pipeline_metrics.add_usage(result.get('usage'))
             orientation_response = result['choices'][0]['message']['content']
             # Sanitize the response
             orientation_response = sanitize_text(orientation_response)
@@ -139,46 +284,14 @@ def detect_image_orientation(image_path):
         logger.error(f"Error detecting orientation: {str(e)}")
         return 0  # Default to no rotation
 
-def capture_and_rotate_image():
-    """Capture an image and auto-rotate it using ChatGPT for orientation detection"""
-    # Create the output directory if it doesn't exist
-    image_output_dir = "/home/username/imageAPI/Pictures"
-    os.makedirs(image_output_dir, exist_ok=True)
-
-    # Fixed filenames
-    raw_image_path = os.path.join(image_output_dir, "capture.jpg")
-    rotated_image_path = os.path.join(image_output_dir, "capture_rotated.jpg")
-
+def capture_image():
+    """Capture a JPEG with the camera and return its bytes, nothing is written to the SD card"""
     try:
-        # Step 1: Capture the raw image
-        capture_cmd = [
-            "libcamera-still",
-            "-o", raw_image_path,
-            "--ev", "0.5",
-            "--width", "1920",
-            "--height", "1080"
-        ]
-        subprocess.run(capture_cmd, check=True)
-        logger.info(f"Image captured and saved to {raw_image_path}")
-
-        # Detect orientation using GPT-4V
-        display_text_on_lcd("Detecting orientation...")
-        detected_rotation = detect_image_orientation(raw_image_path)
-        logger.info(f"Detected rotation angle: {detected_rotation}")
-
-        # Rotate the image if needed
-        if detected_rotation != 0:
-            # Open the image
-            with Image.open(raw_image_path) as captured_img:
-                # Rotate it
-                rotated_img = captured_img.rotate(-detected_rotation, expand=True)  # Negative because PIL rotates counter-clockwise
-                # Save the rotated image
-                rotated_img.save(rotated_image_path)
-                logger.info(f"Image rotated by {detected_rotation} degrees and saved to {rotated_image_path}")
-                return rotated_image_path
-
-        # No rotation needed
-        return raw_image_path
+        with pipeline_metrics.stage("capture"):
+            jpeg_bytes = camera_backend.capture()
+        pipeline_metrics.record("shutter_lag", camera_backend.shutter_lag)
+        logger.info(f"Image captured ({len(jpeg_bytes) / 1024:.0f} KB in memory)")
+        return jpeg_bytes
 
     except subprocess.CalledProcessError as e:
         logger.error(f"Failed to capture image: {e}")
@@ -187,25 +300,193 @@ def capture_and_rotate_image():
         logger.error(f"Unexpected error: {e}")
         return None
 
-def analyze_image_content(image_path):
-    """Analyze and extract content from image using google/gemini-2.5-pro via OpenRouter"""
+def capture_checked_image():
+    """Capture a frame, re-shooting with adjusted exposure while it fails the local quality gate"""
+    jpeg_bytes = capture_image()
+    if not jpeg_bytes:
+        return None
+    derivatives = ImageDerivatives(jpeg_bytes)
+    if not frame_quality.QUALITY_GATE:
+        return derivatives
+
+    ev_offset, shutter_scale = 0.0, 1.0
+    for attempt in range(frame_quality.QUALITY_MAX_RETRIES + 1):
+        # The orientation derivative is decoded here once and reused by the later stages
+        thumbnail = derivatives.stage_image("orientation")
+        with pipeline_metrics.stage("quality_gate"):
+            quality = frame_quality.assess_frame(thumbnail)
+        if quality.problem is None:
+            break
+        if attempt == frame_quality.QUALITY_MAX_RETRIES or not camera_backend.adjustable:
+            logger.warning(f"Frame {quality.problem} ({quality}), describing it anyway")
+            break
+
+        ev_step, shutter_step = quality.adjustment()
+        ev_offset += ev_step
+        shutter_scale *= shutter_step
+        logger.info(f"Frame {quality.problem} ({quality}), retaking at EV {ev_offset:+.1f}, shutter x{shutter_scale:g}")
+        display_text_on_lcd(f"Image {quality.problem}, retaking...")
+        try:
+            with pipeline_metrics.stage("capture"):
+                jpeg_bytes = camera_backend.capture_adjusted(ev_offset, shutter_scale)
+        except Exception as e:
+            logger.error(f"Re-capture failed, keeping the previous frame: {e}")
+            break
+        derivatives = ImageDerivatives(jpeg_bytes)
+    pipeline_metrics.record("recaptures", attempt)
+    return derivatives
+
+def save_capture(derivatives):
+    """Write the upright full-resolution capture next to the history, returns its path and the rotation method"""
+    os.makedirs(HISTORY_IMAGE_DIR, exist_ok=True)
+    image_path = os.path.join(HISTORY_IMAGE_DIR, f"{datetime.datetime.now():%Y%m%d-%H%M%S-%f}.jpg")
+    if derivatives.rotation == 0:
+        # Already upright, the camera's JPEG is written as is
+        jpeg_bytes, method = derivatives.jpeg_bytes(), "none"
+    else:
+        with pipeline_metrics.stage("rotate"):
+            jpeg_bytes, method = jpeg_rotation.rotate_jpeg(derivatives.jpeg_bytes(), derivatives.rotation)
+    with open(image_path, "wb") as image_file:
+        image_file.write(jpeg_bytes)
+    logger.info(f"Capture saved to {image_path} (rotated by {derivatives.rotation} degrees, {method})")
+    return image_path, method
+
+def detect_rotation(derivatives, deadline=None):
+    """Detect how far the capture must be rotated clockwise to be upright"""
+    # Detect orientation on-device, asking GPT-4o only when the estimate is unsure
+    remote_detector = functools.partial(detect_image_orientation, deadline=deadline)
+    with pipeline_metrics.stage("orientation"):
+        detected_rotation = orientation.detect_orientation(derivatives, remote_detector)
+    logger.info(f"Detected rotation angle: {detected_rotation}")
+    return detected_rotation
+
+def orient_captured_image(image_source, deadline=None):
+    """Detect the orientation of a capture and apply it to its upload derivatives"""
+    # Decode once; every stage uploads its own downscaled derivative
+    derivatives = load_derivatives(image_source)
+
+    display_text_on_lcd("Detecting orientation...")
+    derivatives.set_rotation(detect_rotation(derivatives, deadline))
+    return derivatives
+
+def capture_and_rotate_image():
+    """Capture an image and auto-rotate it using ChatGPT for orientation detection"""
+    # Step 1: Capture the raw image
+    derivatives = capture_checked_image()
+    if derivatives is None:
+        return None
+
     try:
-        logger.info(f"Analyzing image content: {image_path}")
+        return orient_captured_image(derivatives)
+    except Exception as e:
+        logger.error(f"Unexpected error: {e}")
+        return None
+
+def analyze_speculatively(image_source, deadline=None):
+    """Analyze the raw frame while orientation detection is still running"""
+    derivatives = load_derivatives(image_source)
+    metrics = pipeline_metrics.current()
+
+    def timed_rotation():
+        # Pool threads do not see the caller's thread-local metrics (queue replay, batch), bind them
+        with pipeline_metrics.bound(metrics):
+            start_time = time.perf_counter()
+            rotation = detect_rotation(derivatives, deadline)
+            return rotation, time.perf_counter() - start_time
+
+    overlap_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        orientation_future = executor.submit(timed_rotation)
+        # The serial pipeline shows this message too, so its SPI push counts on the analysis side
+        analysis_start = time.perf_counter()
+        display_text_on_lcd("Analyzing image content...")
+        with pipeline_metrics.stage("analysis"):
+            analyzed_content = analyze_image_content(derivatives, rotation_check=True, deadline=deadline)
+        analysis_time = time.perf_counter() - analysis_start
+        try:
+            detected_rotation, orientation_time = orientation_future.result()
+        except Exception as e:
+            logger.error(f"Error detecting orientation: {str(e)}")
+            detected_rotation, orientation_time = 0, None
+    overlap_time = time.perf_counter() - overlap_start
+
+    # Serial time of the two finished stages minus the wall time they actually took together
+    if orientation_time is not None:
+        overlap_saved = orientation_time + analysis_time - overlap_time
+        pipeline_metrics.record("overlap_saved", overlap_saved)
+        logger.info(f"Speculative analysis saved {overlap_saved * 1000:.0f} ms of serial latency")
+
+    derivatives.set_rotation(detected_rotation)
+    if ROTATION_SENSITIVE_MARKER in analyzed_content:
+        if detected_rotation != 0:
+            # The model says the sideways frame hurt its answer, redo it upright
+            logger.info("Analysis depends on orientation, re-running on the rotated image")
+            display_text_on_lcd("Analyzing image content...")
+            with pipeline_metrics.stage("analysis_rerun"):
+                analyzed_content = analyze_image_content(derivatives, deadline=deadline)
+        else:
+            analyzed_content = analyzed_content.replace(ROTATION_SENSITIVE_MARKER, "").strip()
 
-        # Encode image to base64
-        encoded_image = encode_image_to_base64(image_path)
-        if not encoded_image:
+    return derivatives, analyzed_content
+
+def send_analysis_request(data, deadline=None):
+    """Send an analysis request, streamed to the LCD and hedged when enabled, and return its text"""
+    if STREAM_RESPONSES:
+        try:
+            if ANALYSIS_HEDGING:
+                start_time = time.monotonic()
+                deltas = hedged_analysis_stream(data, deadline)
+                analyzed_content = render_stream_to_lcd(deltas, "Analyzing image content...\n\n", "analysis", start_time)
+            else:
+                analyzed_content = stream_completion_to_lcd(data, "Analyzing image content...\n\n", "analysis", deadline)
+            logger.info("Successfully analyzed image content")
+            return analyzed_content
+        except openrouter_client.OpenRouterError as e:
+            logger.error(f"OpenRouter API error: {e}")
+            return f"Error: {e}"
+
+    # Make the API request over the shared connection pool
+    if ANALYSIS_HEDGING:
+        response = hedged_analysis_request(data, deadline)
+    else:
+        response = api_client.chat_completion(data, stage="analysis", deadline=deadline)
+
+    # Check for successful response
+    if response.status_code == 200:
+        result = response.json()
+        pipeline_metrics.add_usage(result.get('usage'))
+        analyzed_content = result['choices'][0]['message']['content']
+        # Sanitize the extracted content
+        analyzed_content = sanitize_text(analyzed_content)
+        logger.info("Successfully analyzed image content")
+        return analyzed_content
+    else:
+        logger.error(f"OpenRouter API error: {response.status_code} - {response.text}")
+        return f"Error: {response.status_code} - {response.text}"
+
+def analyze_image_content(image_source, rotation_check=False, deadline=None):
+    """Analyze and extract content from image using google/gemini-2.5-pro via OpenRouter"""
+    try:
+        derivatives = load_derivatives(image_source)
+        logger.info(f"Analyzing image content: {derivatives.name}")
+
+        model = router.select("analysis")
+        # A hedged request may be answered by the secondary model, so it must take the codec too
+        models = [model, HEDGE_SECONDARY_MODEL] if ANALYSIS_HEDGING else [model]
+        # Encode the analysis-sized derivative to base64
+        image_url = derivatives.data_url("analysis", model_router.accepted_codecs(*models))
+        if not image_url.base64_bytes:
             return "Error encoding image"
 
-        # Prepare the request
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {OPENAPI_KEY}"
-        }
+        analysis_prompt = "Analyze this image and identify what items, objects, or content you can see. Do not include the background. Just analyse the product or object in the image."
+        if rotation_check:
+            # The frame may not be upright yet, let the model flag when that matters
+            analysis_prompt += f" If the image is rotated or upside down and that stops you from reading text or identifying the object, end your reply with the word {ROTATION_SENSITIVE_MARKER}."
 
         # Use Gemini for content analysis
         data = {
-            "model": "google/gemini-2.5-pro-preview-05-06",
+            "model": model,
+            "provider": router.provider_preferences("analysis"),
             "messages": [
                 {
                     "role": "system",
@@ -216,12 +497,12 @@ def analyze_image_content(image_path):
                     "content": [
                         {
                             "type": "text",
-                            "text": "Analyze this image and identify what items, objects, or content you can see. Do not include the background. Just analyse the product or object in the image."
+                            "text": analysis_prompt
                         },
                         {
                             "type": "image_url",
                             "image_url": {
-                                "url": f"data:image/jpeg;base64,{encoded_image}"
+                                "url": image_url
                             }
                         }
                     ]
@@ -229,44 +510,125 @@ def analyze_image_content(image_path):
             ]
         }
 
-        # Make the API request
-        response = requests.post(
-            "https://openrouter.ai/api/v1/chat/completions",
-            headers=headers,
-            json=data
-        )
+        return send_analysis_request(data, deadline)
+
+    except Exception as e:
+        logger.error(f"Error in image analysis: {str(e)}")
+        logger.error(f"Error details: {sys.exc_info()}")
+        return f"Error analyzing image: {str(e)}"
+
+def analyze_multiple_images(shots, deadline=None):
+    """Analyze several views of one subject in a single request with one image part per view"""
+    try:
+        model = router.select("analysis")
+        models = [model, HEDGE_SECONDARY_MODEL] if ANALYSIS_HEDGING else [model]
+        accepted = model_router.accepted_codecs(*models)
+        logger.info(f"Analyzing {len(shots)} views in one request")
+
+        content = [
+            {
+                "type": "text",
+                "text": f"These {len(shots)} images show the same product or object from different sides. Analyze them together and identify what items, objects, or content you can see, combining the details from every view into one analysis. Do not include the background. Some views may be rotated; read them as they are."
+            }
+        ]
+        for shot in shots:
+            image_url = shot.data_url("analysis", accepted)
+            if not image_url.base64_bytes:
+                return "Error encoding image"
+            content.append({"type": "image_url", "image_url": {"url": image_url}})
+
+        data = {
+            "model": model,
+            "provider": router.provider_preferences("analysis"),
+            "messages": [
+                {
+                    "role": "system",
+                    "content": "You are an image analysis specialist. Your task is to accurately identify and describe the contents of images."
+                },
+                {
+                    "role": "user",
+                    "content": content
+                }
+            ]
+        }
+
+        return send_analysis_request(data, deadline)
+
+    except Exception as e:
+        logger.error(f"Error in multi-shot analysis: {str(e)}")
+        return f"Error analyzing images: {str(e)}"
+
+def describe_image_fast(image_source, deadline=None):
+    """Get orientation, objects and a display-ready summary from one structured vision call"""
+    try:
+        derivatives = load_derivatives(image_source)
+        logger.info(f"Describing image in a single call: {derivatives.name}")
+
+        model = router.select("fast")
+        # Encode the analysis-sized derivative to base64
+        image_url = derivatives.data_url("analysis", model_router.accepted_codecs(model))
+
+        data = {
+            "model": model,
+            "provider": router.provider_preferences("fast"),
+            "messages": [
+                {
+                    "role": "system",
+                    "content": "You are an image analysis specialist. Your task is to accurately identify the contents of images and describe them clearly and briefly."
+                },
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "text",
+                            "text": "Identify the items, objects, or content in this image. Do not include the background, just the product or object. Also report the clockwise rotation (0, 90, 180 or 270 degrees) needed to make the image upright."
+                        },
+                        {
+                            "type": "image_url",
+                            "image_url": {
+                                "url": image_url
+                            }
+                        }
+                    ]
+                }
+            ],
+            "response_format": {
+                "type": "json_schema",
+                "json_schema": FAST_PATH_SCHEMA
+            },
+            "temperature": 0.3
+        }
+
+        # Make the API request over the shared connection pool
+        response = api_client.chat_completion(data, stage="fast", deadline=deadline)
 
-        # Check for successful response
         if response.status_code == 200:
             result = response.json()
-            analyzed_content = result['choices'][0]['message']['content']
-            # Sanitize the extracted content
-            analyzed_content = sanitize_text(analyzed_content)
-            logger.info("Successfully analyzed image content")
-            return analyzed_content
+            pipeline_metrics.add_usage(result.get('usage'))
+            structured = json.loads(result['choices'][0]['message']['content'])
+            rotation = structured.get("rotation", 0)
+            if rotation not in [0, 90, 180, 270]:
+                rotation = 0
+            logger.info(f"Fast path found: {', '.join(structured.get('objects', []))}")
+            return rotation, sanitize_text(structured.get("summary", ""))
         else:
             logger.error(f"OpenRouter API error: {response.status_code} - {response.text}")
-            return f"Error: {response.status_code} - {response.text}"
+            return 0, f"Error: {response.status_code} - {response.text}"
 
     except Exception as e:
-        logger.error(f"Error in image analysis: {str(e)}")
+        logger.error(f"Error in fast path description: {str(e)}")
         logger.error(f"Error details: {sys.exc_info()}")
-        return f"Error analyzing image: {str(e)}"
+        return 0, f"Error describing image: {str(e)}"
 
-def generate_description_with_gemini(image_content):
+def generate_description_with_gemini(image_content, deadline=None):
     """Generate detailed description using Gemini"""
     try:
         logger.info("Generating detailed description...")
 
-        # Prepare the request
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {OPENAPI_KEY}"
-        }
-
         # Use Gemini for generating detailed description
         data = {
-            "model": "google/gemini-2.5-pro",
+            "model": router.select("description"),
+            "provider": router.provider_preferences("description"),
             "messages": [
                 {
                     "role": "system",
@@ -290,16 +652,22 @@ Please describe what you can identify in this image, including:
             "temperature": 0.3
         }
 
-        # Make the API request
-        response = requests.post(
-            "https://openrouter.ai/api/v1/chat/completions",
-            headers=headers,
-            json=data
-        )
+        if STREAM_RESPONSES:
+            try:
+                detailed_description = stream_completion_to_lcd(data, label="description", deadline=deadline)
+                logger.info("Successfully generated description")
+                return detailed_description
+            except openrouter_client.OpenRouterError as e:
+                logger.error(f"OpenRouter API error: {e}")
+                return f"Error: {e}"
+
+        # Make the API request over the shared connection pool
+        response = api_client.chat_completion(data, stage="description", deadline=deadline)
 
         # Check for successful response
         if response.status_code == 200:
             result = response.json()
+            pipeline_metrics.add_usage(result.get('usage'))
             detailed_description = result['choices'][0]['message']['content']
             # Sanitize the description
             detailed_description = sanitize_text(detailed_description)
@@ -314,6 +682,17 @@ Please describe what you can identify in this image, including:
         logger.error(f"Error details: {sys.exc_info()}")
         return f"Error generating description: {str(e)}"
 
+@functools.lru_cache(maxsize=None)
+def load_display_font(font_size):
+    """Load the LCD font once, streaming redraws happen several times a second"""
+    try:
+        return ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSansMono.ttf", font_size)
+    except IOError:
+        try:
+            return ImageFont.truetype("/usr/share/fonts/truetype/liberation/LiberationMono-Regular.ttf", font_size)
+        except IOError:
+            return ImageFont.load_default()
+
 def display_text_on_lcd(text, scroll_position=0, content_type="normal"):
     """Display text on LCD with 270-degree rotation and better top padding"""
     global lcd_display
@@ -321,12 +700,15 @@ def display_text_on_lcd(text, scroll_position=0, content_type="normal"):
     # Sanitize text before display
     text = sanitize_text(text)
 
+    if getattr(lcd_output, "muted", False):
+        return 0
+
     if lcd_display is None:
         logger.error("Display not initialized")
         return 0
 
-    # Clear the display
-    lcd_display.clear()
+    # No clear first: the frame below covers the whole panel, so a clear would only double the SPI traffic
+    render_start = time.perf_counter()
 
     # Create image with original dimensions first
     display_width = lcd_display.width
@@ -337,13 +719,7 @@ def display_text_on_lcd(text, scroll_position=0, content_type="normal"):
 
     # Font setup
     font_size = 14
-    try:
-        display_font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSansMono.ttf", font_size)
-    except IOError:
-        try:
-            display_font = ImageFont.truetype("/usr/share/fonts/truetype/liberation/LiberationMono-Regular.ttf", font_size)
-        except IOError:
-            display_font = ImageFont.load_default()
+    display_font = load_display_font(font_size)
 
     # Padding settings
     horizontal_padding = 10
@@ -415,35 +791,203 @@ def display_text_on_lcd(text, scroll_position=0, content_type="normal"):
         rotated_lcd_image = rotated_lcd_image.resize((lcd_display.width, lcd_display.height))
 
     # Update the display with rotated image
-    lcd_display.ShowImage(rotated_lcd_image)
+    pipeline_metrics.add("render", time.perf_counter() - render_start)
+    with pipeline_metrics.stage("spi_push"):
+        lcd_display.ShowImage(rotated_lcd_image)
 
     return len(wrapped_text_lines)
 
+def crop_to_subject(derivatives):
+    """Crop the analysis upload to the subject when the local estimate is confident, else keep the full frame"""
+    if not roi.ROI_CROP:
+        return
+    # Runs before orientation, on the frame as shot
+    with pipeline_metrics.stage("roi"):
+        region = roi.estimate_roi(derivatives.stage_image("orientation"))
+    if region is not None and region.usable():
+        derivatives.set_crop(region.box)
+        logger.info(f"Cropping the upload to the subject: {region}")
+    else:
+        derivatives.set_crop(None)
+        logger.info(f"Uploading the full frame ({region or 'no edges found'})")
+
+def describe_image(image_source, mode=None, deadline=None):
+    """Run a captured frame through the selected pipeline mode and return its description"""
+    mode = mode or PIPELINE_MODE
+    derivatives = load_derivatives(image_source)
+    crop_to_subject(derivatives)
+
+    if mode == "fast":
+        # Orientation, analysis and description in one structured vision call
+        display_text_on_lcd("Describing image...")
+        with pipeline_metrics.stage("description"):
+            detected_rotation, description = describe_image_fast(derivatives, deadline)
+        logger.info(f"Detected rotation angle: {detected_rotation}")
+        derivatives.set_rotation(detected_rotation)
+        return description
+
+    if mode == "speculative":
+        # Detect orientation and analyze concurrently
+        derivatives, analyzed_content = analyze_speculatively(derivatives, deadline)
+    else:
+        # Detect orientation, then analyze the upright image
+        derivatives = orient_captured_image(derivatives, deadline)
+        display_text_on_lcd("Analyzing image content...")
+        with pipeline_metrics.stage("analysis"):
+            analyzed_content = analyze_image_content(derivatives, deadline=deadline)
+
+    # A failed analysis is not something to describe, hand the error back like the multi-shot path does
+    if analyzed_content.startswith("Error"):
+        return analyzed_content
+    if not analyzed_content.strip():
+        return "Error: the analysis came back empty"
+
+    # Print analyzed content for debugging
+    print("\nAnalyzed Image Content:")
+    print(analyzed_content)
+
+    # Generate detailed description with Gemini
+    display_text_on_lcd("Generating description...")
+    with pipeline_metrics.stage("description"):
+        return generate_description_with_gemini(analyzed_content, deadline)
+
+def describe_queued_capture(job):
+    """Describe a capture from the offline queue in the background, without drawing on the LCD"""
+    lcd_output.muted = True
+    try:
+        with pipeline_metrics.background_capture() as metrics:
+            deadline = request_policy.Deadline()
+            if len(job["images"]) > 1:
+                description = describe_shots([load_derivatives(image) for image in job["images"]], deadline)
+            else:
+                description = describe_image(job["images"][0], deadline=deadline)
+    finally:
+        lcd_output.muted = False
+    # Raising keeps the job queued for another attempt instead of recording the error as its description
+    if description.startswith("Error"):
+        raise RuntimeError(description)
+    logger.info(f"Queued capture timings: {metrics.summary()}")
+    return description
+
+def record_queued_description(job, description):
+    """Send the description of a queued capture to the history"""
+    if capture_history is not None:
+        capture_history.add(description, job["captured_at"], source="queued")
+    logger.info(f"Queued capture {job['id']} described, {len(offline_queue)} still queued")
+
+def queue_capture(jpeg_bytes):
+    """Keep a capture (or a list of multi-shot views) taken while offline so the queue worker can describe it later"""
+    try:
+        offline_queue.enqueue(jpeg_bytes)
+    except Exception as e:
+        logger.error(f"Failed to queue capture: {e}")
+        display_text_on_lcd("Offline and the capture could not be saved. Please try again later.")
+        return
+    if queue_worker is not None:
+        queue_worker.mark_offline()
+        queue_worker.wake()
+    display_text_on_lcd(f"Offline: capture saved\n{len(offline_queue)} waiting for upload\n\nResults will appear in the history (UP + DOWN)")
+
+def add_to_history(derivatives, description):
+    """Record a live description, writing the capture to the SD card only when history images are kept"""
+    if capture_history is None:
+        return
+    image_path = None
+    rotation = 0
+    if CAPTURE_HISTORY_IMAGES:
+        try:
+            image_path, method = save_capture(derivatives)
+            if method == "derivative":
+                # The saved file is as shot, viewers need the angle
+                rotation = derivatives.rotation
+        except Exception as e:
+            logger.error(f"Failed to save capture: {e}")
+    capture_history.add(description, image=image_path, rotation=rotation)
+
+def show_history_entry(position):
+    """Show one history entry on the LCD (0 is the newest), returns the position shown"""
+    entries = capture_history.entries() if capture_history is not None else []
+    if not entries:
+        display_text_on_lcd("History is empty")
+        return 0
+    position = max(0, min(position, len(entries) - 1))
+    entry = entries[position]
+    captured_at = datetime.datetime.fromtimestamp(entry["captured_at"]).strftime("%Y-%m-%d %H:%M")
+    source = " (queued)" if entry.get("source") == "queued" else ""
+    display_text_on_lcd(f"History {position + 1}/{len(entries)}{source}\n{captured_at}\n\n{entry['description']}")
+    return position
+
 def capture_and_describe_image():
     """Capture image and generate description using two-step approach"""
-    global image_description, current_scroll_position
+    global current_scroll_position
 
     # Reset scroll position
     current_scroll_position = 0
+    metrics = pipeline_metrics.start_capture()
 
-    # Step 1: Capture image with auto-rotation
+    # One time budget for the whole capture; slow early stages leave less for later ones
+    deadline = request_policy.Deadline()
+
+    # Step 1: Capture image
     display_text_on_lcd("Capturing image...")
-    captured_image_path = capture_and_rotate_image()
-    if not captured_image_path:
+    derivatives = capture_checked_image()
+    if derivatives is None:
         display_text_on_lcd("Failed to capture image. Please try again.")
         return
 
-    # Step 2: Analyze image content
-    display_text_on_lcd("Analyzing image content...")
-    analyzed_content = analyze_image_content(captured_image_path)
+    describe_capture(derivatives, metrics, deadline)
 
-    # Print analyzed content for debugging
-    print("\nAnalyzed Image Content:")
-    print(analyzed_content)
+def describe_capture(derivatives, metrics, deadline=None):
+    """Describe one capture and show it: cache, offline queue, pipeline, history"""
+    global image_description
 
-    # Step 3: Generate detailed description with Gemini
-    display_text_on_lcd("Generating description...")
-    image_description = generate_description_with_gemini(analyzed_content)
+    # Repeat scans of the same product are answered from the cache
+    frame_hash = None
+    if description_cache is not None:
+        try:
+            with pipeline_metrics.stage("cache_lookup"):
+                frame_hash = result_cache.perceptual_hash(derivatives.stage_image("orientation"))
+                cached_description = description_cache.lookup(frame_hash)
+        except Exception as e:
+            logger.error(f"Result cache lookup failed: {e}")
+            frame_hash = cached_description = None
+        if cached_description:
+            image_description = cached_description
+            add_to_history(derivatives, image_description)
+            display_text_on_lcd(image_description, current_scroll_position)
+            logger.info(f"Capture timings: {metrics.summary()}")
+            return
+
+    # Known to be offline: queue straight away instead of waiting for timeouts
+    if queue_worker is not None and queue_worker.offline:
+        queue_capture(derivatives.jpeg_bytes())
+        return
+
+    # Steps 2 and 3: Orientation, analysis and description in the configured pipeline mode
+    try:
+        image_description = describe_image(derivatives, deadline=deadline)
+    except Exception as e:
+        logger.error(f"Unexpected error: {e}")
+        display_text_on_lcd("Failed to process image. Please try again.")
+        return
+
+    # describe_image hands back the first failing stage's error, so this covers analysis and description
+    succeeded = bool(image_description.strip()) and not image_description.startswith("Error")
+
+    # A failure with the endpoint unreachable means we are offline; keep the capture
+    if not succeeded and offline_queue is not None and not api_client.is_reachable():
+        queue_capture(derivatives.jpeg_bytes())
+        return
+
+    if succeeded:
+        add_to_history(derivatives, image_description)
+
+    # Error replies are not worth repeating from the cache
+    if frame_hash is not None and succeeded:
+        try:
+            description_cache.store(frame_hash, image_description)
+        except Exception as e:
+            logger.error(f"Result cache store failed: {e}")
 
     # Print description for debugging
     print("\nGenerated Description:")
@@ -451,9 +995,89 @@ def capture_and_describe_image():
 
     # Step 4: Display the description
     display_text_on_lcd(image_description, current_scroll_position)
+    logger.info(f"Capture timings: {metrics.summary()}")
+
+def add_shot():
+    """Capture one view for multi-shot mode; the group is described once full or when the window closes"""
+    global last_shot_time, current_scroll_position
+    if not pending_shots:
+        current_scroll_position = 0
+        pipeline_metrics.start_capture()
+    display_text_on_lcd(f"Capturing shot {len(pending_shots) + 1}...")
+    derivatives = capture_checked_image()
+    if derivatives is None:
+        display_text_on_lcd("Failed to capture image. Please try again.")
+        return
+    pending_shots.append(derivatives)
+    last_shot_time = time.monotonic()
+    if len(pending_shots) >= MULTI_SHOT_MAX:
+        describe_pending_shots()
+    else:
+        display_text_on_lcd(f"Shot {len(pending_shots)} of up to {MULTI_SHOT_MAX} taken\n\n"
+                            f"Press CAPTURE within {MULTI_SHOT_WINDOW:.0f}s to add another side")
+
+def describe_pending_shots():
+    """Describe the multi-shot group and show it, or queue the group as one job while offline"""
+    global image_description
+    shots = pending_shots[:]
+    pending_shots.clear()
+    metrics = pipeline_metrics.current()
+    deadline = request_policy.Deadline()
+    if len(shots) == 1:
+        describe_capture(shots[0], metrics, deadline)
+        return
+
+    if queue_worker is not None and queue_worker.offline:
+        queue_capture([shot.jpeg_bytes() for shot in shots])
+        return
+
+    image_description = describe_shots(shots, deadline)
+    if image_description.startswith("Error"):
+        if offline_queue is not None and not api_client.is_reachable():
+            queue_capture([shot.jpeg_bytes() for shot in shots])
+            return
+    else:
+        # The first view stands for the group in the history
+        add_to_history(shots[0], image_description)
+
+    print("\nGenerated Description:")
+    print(image_description)
+    display_text_on_lcd(image_description, current_scroll_position)
+    logger.info(f"Multi-shot ({len(shots)} views) timings: {metrics.summary()}")
+
+def describe_shots(shots, deadline=None):
+    """Describe a multi-shot group: one analysis request for every view, then one description"""
+    for shot in shots:
+        crop_to_subject(shot)
+        # Only confident local estimates are applied, the model copes with rotated views
+        angle, confidence = orientation.estimate_orientation(shot.stage_image("orientation"))
+        if confidence >= orientation.ORIENTATION_CONFIDENCE_THRESHOLD:
+            shot.set_rotation(angle)
+
+    display_text_on_lcd(f"Analyzing {len(shots)} shots...")
+    with pipeline_metrics.stage("analysis"):
+        analyzed_content = analyze_multiple_images(shots, deadline)
+    if analyzed_content.startswith("Error"):
+        return analyzed_content
+
+    print("\nAnalyzed Image Content:")
+    print(analyzed_content)
+    display_text_on_lcd("Generating description...")
+    with pipeline_metrics.stage("description"):
+        return generate_description_with_gemini(analyzed_content, deadline)
 
 def main():
-    global lcd_display, current_scroll_position, image_description
+    global lcd_display, current_scroll_position, image_description, queue_worker, history_position
+
+    # Import LCD module
+    try:
+        from lib import LCD_1inch5
+        print("LCD imported")
+    except ImportError as e:
+        print(f"LCD import error: {e}")
+        sys.exit(1)
+
+    setup_gpio()
 
     try:
         # Initialize the display
@@ -461,16 +1085,66 @@ def main():
         lcd_display.Init()
         lcd_display.clear()
 
+        # Open the OpenRouter connection now so the first capture skips the handshakes
+        api_client.start_keepalive()
+
+        # Start the sensor streaming now so a press only waits for the next frame
+        try:
+            camera_backend.start()
+        except Exception as e:
+            logger.error(f"Failed to start camera: {e}")
+
+        # Describe captures queued while offline as soon as the endpoint is reachable
+        if offline_queue is not None:
+            queue_worker = capture_queue.QueueWorker(offline_queue, describe_queued_capture,
+                                                     record_queued_description, api_client.is_reachable)
+            queue_worker.start()
+            if len(offline_queue):
+                queue_worker.wake()
+
         display_text_on_lcd("Image Analyzer Ready\nPress CAPTURE button to take a photo")
 
         while True:
             # Button handling with debouncing
             if not GPIO.input(BUTTON_CAPTURE):
                 print("Capture button pressed")
-                display_text_on_lcd("Capturing image...")
-                capture_and_describe_image()
+                history_position = None
+                if MULTI_SHOT:
+                    add_shot()
+                else:
+                    display_text_on_lcd("Capturing image...")
+                    capture_and_describe_image()
                 time.sleep(0.5)  # Debounce delay
 
+            # A multi-shot group is described once no further shot came within the window
+            if pending_shots and time.monotonic() - last_shot_time >= MULTI_SHOT_WINDOW:
+                describe_pending_shots()
+
+            # UP and DOWN pressed together open or close the capture history
+            if not GPIO.input(BUTTON_UP) or not GPIO.input(BUTTON_DOWN):
+                time.sleep(0.05)  # Give the second button time to land
+                if not GPIO.input(BUTTON_UP) and not GPIO.input(BUTTON_DOWN):
+                    if history_position is None:
+                        print("History opened")
+                        history_position = show_history_entry(0)
+                    else:
+                        print("History closed")
+                        history_position = None
+                        display_text_on_lcd(image_description or "Image Analyzer Ready\nPress CAPTURE button to take a photo",
+                                            current_scroll_position)
+                    time.sleep(0.5)
+                    continue
+
+            if history_position is not None:
+                # UP shows newer entries, DOWN older ones
+                if not GPIO.input(BUTTON_UP):
+                    history_position = show_history_entry(history_position - 1)
+                    time.sleep(0.3)
+                if not GPIO.input(BUTTON_DOWN):
+                    history_position = show_history_entry(history_position + 1)
+                    time.sleep(0.3)
+                continue
+
             if not GPIO.input(BUTTON_UP) and image_description:
                 print("Up button pressed")
                 if current_scroll_position > 0:
@@ -503,6 +1177,14 @@ def main():
         logger.error(f"Unexpected error in main: {e}")
     finally:
         try:
+            if queue_worker is not None:
+                queue_worker.stop()
+            if offline_queue is not None:
+                offline_queue.close()
+            camera_backend.close()
+            api_client.close()
+            if description_cache is not None:
+                description_cache.close()
             GPIO.cleanup()
             lcd_display.module_exit()
         except:
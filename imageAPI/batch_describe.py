@@ -0,0 +1,178 @@
+"""Describe a folder of archived photos with the same pipeline as the camera.
+
+Run from the imageAPI directory:
+
+    python batch_describe.py /path/to/photos --output results.jsonl --concurrency 4
+    python batch_describe.py "/archive/**/*.jpg" --output results.csv --rate 30
+
+Results are appended as each image finishes, so an interrupted run picks up
+where it left off when started again with the same output file.
+"""
+import os
+import csv
+import sys
+import glob
+import json
+import time
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp")
+RESULT_FIELDS = ["image", "status", "description", "seconds", "prompt_tokens", "completion_tokens"]
+
+class RateLimiter:
+    """Spaces out starts so no more than per_minute happen in any minute, shared by all workers"""
+
+    def __init__(self, per_minute):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self._next_start = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start_at = max(now, self._next_start)
+            self._next_start = start_at + self.interval
+        if start_at > now:
+            time.sleep(start_at - now)
+
+def find_images(source):
+    """Images in a directory (recursively) or matching a glob, in a stable order"""
+    if os.path.isdir(source):
+        paths = [os.path.join(root, name) for root, _, names in os.walk(source) for name in names]
+    else:
+        paths = glob.glob(source, recursive=True)
+    return sorted(path for path in paths if path.lower().endswith(IMAGE_EXTENSIONS))
+
+def load_finished(output_path, as_csv):
+    """Images already described successfully by an earlier run"""
+    if not os.path.exists(output_path):
+        return set()
+    finished = set()
+    with open(output_path, "r", encoding="utf-8", newline="") as output_file:
+        if as_csv:
+            rows = csv.DictReader(output_file)
+        else:
+            rows = []
+            for line in output_file:
+                try:
+                    rows.append(json.loads(line))
+                except ValueError:
+                    # Line cut short by the interruption
+                    continue
+        for row in rows:
+            if row.get("status") == "ok":
+                finished.add(row["image"])
+    return finished
+
+class ResultWriter:
+    """Appends one JSONL line or CSV row per image and flushes it straight away"""
+
+    def __init__(self, output_path, as_csv):
+        self.as_csv = as_csv
+        write_header = as_csv and (not os.path.exists(output_path) or os.path.getsize(output_path) == 0)
+        self._file = open(output_path, "a", encoding="utf-8", newline="")
+        self._csv = csv.DictWriter(self._file, fieldnames=RESULT_FIELDS) if as_csv else None
+        if write_header:
+            self._csv.writeheader()
+        self._lock = threading.Lock()
+
+    def write(self, result):
+        with self._lock:
+            if self._csv is not None:
+                self._csv.writerow(result)
+            else:
+                self._file.write(json.dumps(result) + "\n")
+            self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+def describe_one(script, pipeline_metrics, image_path, mode, limiter):
+    """Run one archived image through the pipeline, returns its result row"""
+    limiter.wait()
+    # Batch work has no screen to draw on
+    script.lcd_output.muted = True
+    start_time = time.monotonic()
+    with pipeline_metrics.background_capture() as metrics:
+        try:
+            description = script.describe_image(image_path, mode, deadline=script.request_policy.Deadline())
+        except Exception as e:
+            description = f"Error: {e}"
+    values = metrics.as_dict()["values"]
+    return {
+        "image": image_path,
+        "status": "error" if description.startswith("Error") else "ok",
+        "description": description,
+        "seconds": round(time.monotonic() - start_time, 3),
+        "prompt_tokens": values.get("prompt_tokens", 0),
+        "completion_tokens": values.get("completion_tokens", 0)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Describe a directory or glob of images")
+    parser.add_argument("source", help="Directory (searched recursively) or glob such as 'photos/**/*.jpg'")
+    parser.add_argument("--output", default="batch_results.jsonl", help="JSONL or .csv file, appended to and used to resume")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("BATCH_CONCURRENCY", "4")),
+                        help="Images in flight at once")
+    parser.add_argument("--rate", type=float, default=float(os.getenv("BATCH_RATE_LIMIT", "0")),
+                        help="Maximum images started per minute (0 for no limit)")
+    parser.add_argument("--mode", default=None, help="Pipeline mode, defaults to PIPELINE_MODE")
+    args = parser.parse_args()
+
+    # Imported late so the camera script only loads once the arguments are valid
+    import RaspBerryPiScript as script
+    import pipeline_metrics
+
+    if args.mode and args.mode not in script.PIPELINE_MODES:
+        print(f"Unknown mode: {args.mode}")
+        sys.exit(1)
+
+    as_csv = args.output.lower().endswith(".csv")
+    images = find_images(args.source)
+    finished = load_finished(args.output, as_csv)
+    todo = [image for image in images if image not in finished]
+    print(f"{len(images)} images found, {len(images) - len(todo)} already described, {len(todo)} to go")
+    if not todo:
+        return
+
+    writer = ResultWriter(args.output, as_csv)
+    limiter = RateLimiter(args.rate)
+    latencies = []
+    errors = 0
+    start_time = time.monotonic()
+    executor = ThreadPoolExecutor(max_workers=max(1, args.concurrency), thread_name_prefix="batch")
+    try:
+        futures = [executor.submit(describe_one, script, pipeline_metrics, image, args.mode, limiter) for image in todo]
+        for done_count, future in enumerate(as_completed(futures), 1):
+            result = future.result()
+            writer.write(result)
+            latencies.append(result["seconds"])
+            if result["status"] != "ok":
+                errors += 1
+                logger.error(f"{result['image']}: {result['description']}")
+            print(f"[{done_count}/{len(todo)}] {result['image']} ({result['seconds']:.1f}s)")
+    except KeyboardInterrupt:
+        print("Interrupted, run again with the same output file to resume")
+        executor.shutdown(wait=False, cancel_futures=True)
+    finally:
+        executor.shutdown(wait=False)
+        writer.close()
+        script.api_client.close()
+
+    elapsed = time.monotonic() - start_time
+    if latencies:
+        p50, p90, p95, p99 = np.percentile(latencies, [50, 90, 95, 99])
+        print(f"Described {len(latencies)} images ({errors} errors) in {elapsed:.0f}s: "
+              f"{len(latencies) / elapsed * 60:.1f} images/min")
+        print(f"Latency p50={p50:.1f}s p90={p90:.1f}s p95={p95:.1f}s p99={p99:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""End-to-end latency of capture_and_describe_image, fully off-device.
+
+Drives the real capture path with the file or synthetic camera, a fake LCD (with
+simulated SPI time) and the local OpenRouter stand-in, then saves a
+per-stage breakdown as JSON. Run from the imageAPI directory:
+
+    python -m benchmarks.end_to_end capture.jpg --runs 10
+    python -m benchmarks.end_to_end capture.jpg --first-token-delay lognormal:0.4:0.5 --error-rate 0.1
+    python -m benchmarks.end_to_end capture.jpg --compare e2e_1a2b3c4d.json
+    python -m benchmarks.end_to_end --camera synthetic
+    python -m benchmarks.end_to_end --camera synthetic --multi-shot 3
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+
+from benchmarks.mock_openrouter import start_mock_server, base_url, add_server_arguments, server_config
+from benchmarks.fakes import FakeLCD
+
+REPORTED_STAGES = ["capture", "encode", "orientation", "analysis", "description", "render", "spi_push"]
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def summarize(runs):
+    """p50/p95/mean milliseconds per stage (and in total) over all runs"""
+    stages = REPORTED_STAGES + sorted({name for run in runs for name in run["stages"]} - set(REPORTED_STAGES))
+    summary = {}
+    for name in stages + ["total"]:
+        values = np.array([run["total"] if name == "total" else run["stages"].get(name, 0.0) for run in runs]) * 1000
+        summary[name] = {
+            "p50_ms": round(float(np.percentile(values, 50)), 1),
+            "p95_ms": round(float(np.percentile(values, 95)), 1),
+            "mean_ms": round(float(values.mean()), 1)
+        }
+    return summary
+
+def print_summary(summary, baseline=None):
+    header = f"{'stage':<16} {'p50 ms':>9} {'p95 ms':>9} {'mean ms':>9}"
+    if baseline:
+        header += f" {'base p50':>9} {'change':>8}"
+    print(header)
+    for name, stats in summary.items():
+        line = f"{name:<16} {stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f} {stats['mean_ms']:>9.1f}"
+        if baseline and name in baseline:
+            before = baseline[name]["p50_ms"]
+            change = f"{(stats['p50_ms'] - before) / before * 100:+.0f}%" if before else "-"
+            line += f" {before:>9.1f} {change:>8}"
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end capture latency against the local stand-in")
+    parser.add_argument("image", nargs="?", default="", help="JPEG (or folder of JPEGs) the file camera returns")
+    parser.add_argument("--camera", choices=["file", "synthetic"], default="file",
+                        help="Replay the image, or draw frames from a simulated warm stream")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--mode", default=None, help="Pipeline mode, defaults to PIPELINE_MODE")
+    parser.add_argument("--profile", default=None, help="Capture profile, defaults to CAPTURE_PROFILE")
+    parser.add_argument("--zero-shutter-lag", action="store_true",
+                        help="Return the sharpest recent frame from the ring buffer (synthetic frames get random blur)")
+    parser.add_argument("--multi-shot", type=int, default=1,
+                        help="Shots per run, described together in one analysis request")
+    parser.add_argument("--capture-delay", type=float, default=0.0, help="Simulated camera time per capture")
+    parser.add_argument("--spi-hz", type=int, default=40000000, help="Simulated LCD SPI clock (0 for none)")
+    parser.add_argument("--output", default=None, help="JSON results file (default e2e_<commit>.json)")
+    parser.add_argument("--compare", default=None, help="Earlier results file to compare against")
+    add_server_arguments(parser)
+    args = parser.parse_args()
+    if args.camera == "file" and not args.image:
+        parser.error("the file camera needs an image")
+
+    server = start_mock_server(**server_config(args))
+    os.environ["OPENROUTER_BASE_URL"] = base_url(server)
+    os.environ.setdefault("OPENAPI_KEY", "mock-key")
+    os.environ["CAMERA_BACKEND"] = args.camera
+    os.environ["CAMERA_FILE"] = args.image
+    os.environ["CAMERA_FILE_DELAY"] = str(args.capture_delay)
+    if args.profile:
+        os.environ["CAPTURE_PROFILE"] = args.profile
+    if args.zero_shutter_lag:
+        os.environ["ZERO_SHUTTER_LAG"] = "1"
+    # Every run must reach the API: no description cache, no offline queue, scratch output folder
+    os.environ["RESULT_CACHE"] = "0"
+    os.environ["CAPTURE_QUEUE"] = "0"
+    os.environ["IMAGE_OUTPUT_DIR"] = tempfile.mkdtemp(prefix="end_to_end_")
+    if args.mode:
+        os.environ["PIPELINE_MODE"] = args.mode
+    if args.multi_shot > 1:
+        # The last shot fills the group, so each run is described without waiting for the window
+        os.environ["MULTI_SHOT_MAX"] = str(args.multi_shot)
+
+    # Imported late so the environment above is picked up
+    import RaspBerryPiScript as script
+    import pipeline_metrics
+
+    if script.PIPELINE_MODE not in script.PIPELINE_MODES:
+        print(f"Unknown mode: {script.PIPELINE_MODE}")
+        sys.exit(1)
+
+    script.lcd_display = FakeLCD(args.spi_hz)
+    runs = []
+    for _ in range(args.runs):
+        start_time = time.perf_counter()
+        if args.multi_shot > 1:
+            for _ in range(args.multi_shot):
+                script.add_shot()
+        else:
+            script.capture_and_describe_image()
+        total_time = time.perf_counter() - start_time
+        metrics = pipeline_metrics.current().as_dict()
+        runs.append({
+            "total": total_time,
+            "shutter_lag": metrics["values"].get("shutter_lag", 0.0),
+            "stages": metrics["stages"],
+            "values": metrics["values"],
+            "error": script.image_description.startswith("Error")
+        })
+
+    commit = git_commit()
+    results = {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "mode": script.PIPELINE_MODE,
+        "config": vars(args),
+        "mock": {"requests": server.requests, "errors_injected": server.errors_injected},
+        "errors": sum(run["error"] for run in runs),
+        "lcd_frames": script.lcd_display.frames_shown,
+        "summary": summarize(runs),
+        "runs": runs
+    }
+    server.shutdown()
+    script.api_client.close()
+
+    output_path = args.output or f"e2e_{commit}.json"
+    with open(output_path, "w") as output_file:
+        json.dump(results, output_file, indent=2)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)["summary"]
+        print(f"Compared with {args.compare}")
+    print_summary(results["summary"], baseline)
+    print(f"Shutter lag p50 {np.percentile([run['shutter_lag'] for run in runs], 50) * 1000:.1f} ms")
+    print(f"{args.runs} runs, {results['errors']} errors, {server.requests} API requests "
+          f"({server.errors_injected} injected failures), {results['lcd_frames']} LCD frames")
+    print(f"Saved to {output_path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Off-device stand-ins for the hardware the pipeline talks to."""
+
+import sys
+import time
+import types
+
+class FakeLCD:
+    """Display with the LCD_1inch5 interface that only counts frames"""
+
+    width = 240
+    height = 280
+
+    def __init__(self, spi_hz=0):
+        self.frames_shown = 0
+        # Sleep for as long as a full RGB565 frame takes over SPI at spi_hz (0 to skip)
+        self.push_delay = self.width * self.height * 16 / spi_hz if spi_hz else 0.0
+
+    def ShowImage(self, Image):
+        if Image.size != (self.width, self.height):
+            raise ValueError(f"Image must be same dimensions as display ({self.width}x{self.height}).")
+        time.sleep(self.push_delay)
+        self.frames_shown += 1
+
+    def clear(self):
+        time.sleep(self.push_delay)
+
+    def module_exit(self):
+        pass
+
+class FakeSpiDev:
+    """spidev.SpiDev that does the list or buffer handling of a real write and counts the bytes"""
+
+    bufsiz = 4096
+
+    def __init__(self, bus=0, device=0):
+        self.max_speed_hz = 0
+        self.mode = 0
+        self.bytes_written = 0
+        self.transfers = 0
+
+    def writebytes(self, data):
+        # spidev converts the list item by item, as bytes() does
+        self.bytes_written += len(bytes(data))
+        self.transfers += 1
+
+    def writebytes2(self, data):
+        data = memoryview(data).cast("B")
+        self.bytes_written += len(data)
+        self.transfers += -(-len(data) // self.bufsiz)
+
+    def close(self):
+        pass
+
+class FakeGPIO(types.ModuleType):
+    """RPi.GPIO with the calls the LCD drivers make, all doing nothing"""
+
+    BCM = 11
+    OUT = 0
+    HIGH = 1
+    LOW = 0
+
+    class PWM:
+        def __init__(self, pin, frequency):
+            pass
+
+        def start(self, duty):
+            pass
+
+        def stop(self):
+            pass
+
+        def ChangeDutyCycle(self, duty):
+            pass
+
+        def ChangeFrequency(self, frequency):
+            pass
+
+    def setmode(self, mode):
+        pass
+
+    def setwarnings(self, flag):
+        pass
+
+    def setup(self, pin, mode):
+        pass
+
+    def output(self, pin, value):
+        pass
+
+    def input(self, pin):
+        return 0
+
+def install_fake_hardware():
+    """Put FakeSpiDev and FakeGPIO in place of spidev and RPi.GPIO when they are not installed
+
+    Returns True when the fakes are in use, False on a Pi with the real modules.
+    """
+    try:
+        import spidev
+        import RPi.GPIO
+        return False
+    except ImportError:
+        pass
+    sys.modules["spidev"] = types.SimpleNamespace(SpiDev=FakeSpiDev)
+    gpio = FakeGPIO("RPi.GPIO")
+    sys.modules["RPi"] = types.SimpleNamespace(GPIO=gpio)
+    sys.modules["RPi.GPIO"] = gpio
+    return True
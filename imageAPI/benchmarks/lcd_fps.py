@@ -0,0 +1,116 @@
+"""Frames per second of every LCD driver's ShowImage, before and after the shared RGB565 path.
+
+Run from the imageAPI directory:
+
+    python -m benchmarks.lcd_fps --frames 30
+    python -m benchmarks.lcd_fps --panels 1inch5 --spi-hz 40000000
+
+The legacy path is the conversion every driver used to carry (fancy-indexed NumPy into a
+fresh array, .tolist(), then 4096-element spi_writebyte slices). On a Pi with spidev and
+RPi.GPIO installed the frames really go out on SPI 0.0, so run it with only the panel that
+is wired up. Elsewhere a fake SPI device counts the bytes and the wire time at --spi-hz is
+added to the CPU time; the legacy and shared columns are host time only.
+
+A second table times a text refresh as display_text_on_lcd used to do it (list-built
+clear, then the legacy frame) against what it does now (the frame alone).
+"""
+import io
+import time
+import argparse
+import contextlib
+import importlib
+import numpy as np
+from PIL import Image
+
+from benchmarks.fakes import install_fake_hardware
+
+PANELS = ["0inch85", "0inch96", "1inch14", "1inch28", "1inch3", "1inch47", "1inch5",
+          "1inch54", "1inch69", "1inch8", "1inch9", "2inch", "2inch4"]
+
+def legacy_show_image(lcd, image):
+    """ShowImage as the drivers had it, for the baseline"""
+    np = lcd.np
+    img = np.asarray(image)
+    pix = np.zeros((image.size[1], image.size[0], 2), dtype=np.uint8)
+    pix[...,[0]] = np.add(np.bitwise_and(img[...,[0]],0xF8),np.right_shift(img[...,[1]],5))
+    pix[...,[1]] = np.add(np.bitwise_and(np.left_shift(img[...,[1]],3),0xE0),np.right_shift(img[...,[2]],3))
+    pix = pix.flatten().tolist()
+    lcd.SetWindows(0, 0, lcd.width, lcd.height)
+    lcd.digital_write(lcd.DC_PIN, True)
+    for i in range(0,len(pix),4096):
+        lcd.spi_writebyte(pix[i:i+4096])
+
+def legacy_clear(lcd):
+    """clear() as the drivers had it: a new list of 0xff bytes per call"""
+    _buffer = [0xff]*(lcd.width * lcd.height * 2)
+    lcd.SetWindows(0, 0, lcd.width, lcd.height)
+    lcd.digital_write(lcd.DC_PIN, True)
+    for i in range(0,len(_buffer),4096):
+        lcd.spi_writebyte(_buffer[i:i+4096])
+
+def test_image(width, height):
+    """Gradient frame, so every RGB565 bit changes somewhere"""
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    rgb = np.stack([np.broadcast_to(x, (height, width)), np.broadcast_to(y, (height, width)),
+                    (x + y) / 2], axis=-1)
+    return Image.fromarray(rgb.astype(np.uint8), "RGB")
+
+def seconds_per_frame(lcd, show, image, frames, spi_hz, fake):
+    """(host seconds, simulated wire seconds) per frame; wire time is 0 on real SPI, where it is in the host time"""
+    if fake:
+        lcd.SPI.bytes_written = 0
+    # Some drivers print on every frame
+    with contextlib.redirect_stdout(io.StringIO()):
+        start_time = time.perf_counter()
+        for _ in range(frames):
+            show(image)
+        seconds = (time.perf_counter() - start_time) / frames
+    wire_seconds = lcd.SPI.bytes_written * 8 / spi_hz / frames if fake else 0.0
+    return seconds, wire_seconds
+
+def legacy_text_refresh(lcd, image):
+    legacy_clear(lcd)
+    legacy_show_image(lcd, image)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark LCD frame pushes")
+    parser.add_argument("--panels", default=",".join(PANELS), help="Comma-separated panels, e.g. 1inch5")
+    parser.add_argument("--frames", type=int, default=20)
+    parser.add_argument("--spi-hz", type=int, default=40000000, help="SPI clock for the simulated wire time")
+    args = parser.parse_args()
+
+    fake = install_fake_hardware()
+    print(f"{'fake SPI, wire time at ' + str(args.spi_hz // 1000000) + ' MHz' if fake else 'real SPI'}, "
+          f"{args.frames} frames per panel")
+    print(f"{'panel':<8} {'size':>8} {'legacy ms':>10} {'shared ms':>10} {'wire ms':>8} "
+          f"{'legacy fps':>11} {'shared fps':>11} {'gain':>6}")
+    lcds = {}
+    for panel in args.panels.split(","):
+        module = importlib.import_module(f"lib.LCD_{panel}")
+        lcd = lcds[panel] = getattr(module, f"LCD_{panel}")(spi_freq=args.spi_hz)
+        image = test_image(lcd.width, lcd.height)
+        # Warm-up frame allocates the shared buffer
+        seconds_per_frame(lcd, lcd.ShowImage, image, 1, args.spi_hz, fake)
+        legacy, wire = seconds_per_frame(lcd, lambda frame: legacy_show_image(lcd, frame), image,
+                                         args.frames, args.spi_hz, fake)
+        shared, shared_wire = seconds_per_frame(lcd, lcd.ShowImage, image, args.frames, args.spi_hz, fake)
+        legacy_total, shared_total = legacy + wire, shared + shared_wire
+        print(f"{panel:<8} {f'{lcd.width}x{lcd.height}':>8} {legacy * 1000:>10.2f} {shared * 1000:>10.2f} "
+              f"{shared_wire * 1000:>8.2f} {1 / legacy_total:>11.1f} {1 / shared_total:>11.1f} "
+              f"{legacy_total / shared_total:>5.2f}x")
+
+    print()
+    print("Text refresh: clear + frame before, frame only now (host plus wire time)")
+    print(f"{'panel':<8} {'before ms':>10} {'now ms':>10} {'before KB':>10} {'now KB':>8} {'gain':>6}")
+    for panel, lcd in lcds.items():
+        image = test_image(lcd.width, lcd.height)
+        before = sum(seconds_per_frame(lcd, lambda frame: legacy_text_refresh(lcd, frame), image,
+                                       args.frames, args.spi_hz, fake))
+        now = sum(seconds_per_frame(lcd, lcd.ShowImage, image, args.frames, args.spi_hz, fake))
+        frame_kb = lcd.width * lcd.height * 2 / 1024
+        print(f"{panel:<8} {before * 1000:>10.2f} {now * 1000:>10.2f} {frame_kb * 2:>10.1f} {frame_kb:>8.1f} "
+              f"{before / now:>5.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+"""Local stand-in for the OpenRouter chat-completions API.
+
+Run from the imageAPI directory and point the device at it:
+
+    python -m benchmarks.mock_openrouter --port 8080
+    OPENROUTER_BASE_URL=http://127.0.0.1:8080/api/v1 python RaspBerryPiScript.py
+"""
+import sys
+import json
+import time
+import socket
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_REPLY = ("A white ceramic coffee mug with a blue handle. "
+                 "The mug has a printed logo on the front and is empty.")
+
+class LatencyDistribution:
+    """Delay sampler parsed from a spec: 0.3, uniform:LOW:HIGH, normal:MEAN:STDDEV or lognormal:MEDIAN:SIGMA"""
+
+    def __init__(self, spec, rng=None):
+        self.spec = str(spec)
+        self._rng = rng or random.Random()
+        kind, _, params = self.spec.partition(":")
+        if not params:
+            kind, params = "fixed", kind
+        self.kind = kind
+        self.params = [float(value) for value in params.split(":")]
+        if kind not in ("fixed", "uniform", "normal", "lognormal"):
+            raise ValueError(f"Unknown latency distribution: {self.spec}")
+
+    def sample(self):
+        if self.kind == "uniform":
+            delay = self._rng.uniform(*self.params)
+        elif self.kind == "normal":
+            delay = self._rng.gauss(*self.params)
+        elif self.kind == "lognormal":
+            median, sigma = self.params
+            delay = median * self._rng.lognormvariate(0.0, sigma)
+        else:
+            delay = self.params[0]
+        return max(0.0, delay)
+
+class MockOpenRouterServer(ThreadingHTTPServer):
+    """Chat-completions stand-in with configurable reply text, latency, token rate and injected errors"""
+
+    daemon_threads = True
+
+    def __init__(self, address, reply_text=DEFAULT_REPLY, first_token_delay=0.3,
+                 token_delay=0.03, split_bytes=0, token_rate=None, error_rate=0.0, error_status=503,
+                 stream_error_rate=0.0, upload_rate=0, seed=None):
+        # Simulated uplink in bytes per second, 0 for none (server_bind reads it)
+        self.upload_rate = upload_rate
+        super().__init__(address, MockOpenRouterHandler)
+        self.reply_text = reply_text
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        # Time to the first byte of every reply: a number or a distribution spec
+        self.first_token_delay = LatencyDistribution(first_token_delay, self._rng)
+        # token_rate (tokens per second) wins over a fixed delay between tokens
+        self.token_delay = 1.0 / token_rate if token_rate else token_delay
+        # Write every SSE event in pieces of this many bytes to exercise incremental parsing
+        self.split_bytes = split_bytes
+        # Fraction of requests answered with error_status, and of streams cut by an in-stream error
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.stream_error_rate = stream_error_rate
+        self.requests = 0
+        self.errors_injected = 0
+
+    def server_bind(self):
+        if self.upload_rate:
+            # A small receive window (inherited by accepted sockets) makes the client feel the slow reads
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        super().server_bind()
+
+    def sample_first_token_delay(self):
+        with self._rng_lock:
+            return self.first_token_delay.sample()
+
+    def inject(self, rate):
+        """Decide whether this request gets an injected failure"""
+        with self._rng_lock:
+            failed = rate > 0 and self._rng.random() < rate
+            if failed:
+                self.errors_injected += 1
+            return failed
+
+    def count_request(self):
+        with self._rng_lock:
+            self.requests += 1
+
+    def handle_error(self, request, client_address):
+        # Clients dropping pooled keep-alive connections is expected
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def reply_for(self, request):
+        """Answer orientation prompts with an angle and everything else with the reply text"""
+        system_prompt = str(request.get("messages", [{}])[0].get("content", ""))
+        if "orientation" in system_prompt:
+            return "0"
+        if request.get("response_format", {}).get("type") == "json_schema":
+            return json.dumps({"rotation": 0, "objects": ["mock object"], "summary": self.reply_text})
+        return self.reply_text
+
+class MockOpenRouterHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self):
+        body = self._read_body(int(self.headers.get("Content-Length", 0)))
+        if not self.path.endswith("/chat/completions"):
+            self._send_json(404, {"error": {"code": 404, "message": "Not found"}})
+            return
+
+        request = json.loads(body)
+        self.server.count_request()
+        reply = self.server.reply_for(request)
+        # Rough token counts: ~4 bytes of prompt per token, one token per word
+        usage = {"prompt_tokens": len(body) // 4, "completion_tokens": len(reply.split())}
+        time.sleep(self.server.sample_first_token_delay())
+        if self.server.inject(self.server.error_rate):
+            status = self.server.error_status
+            headers = {"Retry-After": "1"} if status == 429 else {}
+            self._send_json(status, {"error": {"code": status, "message": "Injected error"}}, headers)
+            return
+        if request.get("stream"):
+            self._stream_reply(request, reply, usage)
+        else:
+            self._send_json(200, {
+                "model": request.get("model"),
+                "choices": [{"message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+                "usage": usage
+            })
+
+    def _read_body(self, length):
+        """Read the request body, at upload_rate bytes per second when it is set"""
+        if not self.server.upload_rate:
+            return self.rfile.read(length)
+        blocks = []
+        start_time = time.monotonic()
+        received = 0
+        while received < length:
+            block = self.rfile.read1(min(4096, length - received))
+            if not block:
+                break
+            blocks.append(block)
+            received += len(block)
+            # Pace against the total so far, sleeping off any lead over the simulated link
+            time.sleep(max(0.0, start_time + received / self.server.upload_rate - time.monotonic()))
+        return b"".join(blocks)
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _write_event(self, data):
+        event = data.encode("utf-8")
+        split_bytes = self.server.split_bytes or len(event)
+        for start in range(0, len(event), split_bytes):
+            self._write_chunk(event[start:start + split_bytes])
+
+    def _stream_reply(self, request, reply, usage):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        self._write_event(": OPENROUTER PROCESSING\n\n")
+        stream_error = self.server.inject(self.server.stream_error_rate)
+        words = reply.split(" ")
+        for index, word in enumerate(words):
+            token = word if index == 0 else " " + word
+            chunk = {"model": request.get("model"), "choices": [{"delta": {"content": token}}]}
+            self._write_event(f"data: {json.dumps(chunk)}\n\n")
+            time.sleep(self.server.token_delay)
+            if stream_error:
+                # Provider failure after the first token, sent the way OpenRouter does
+                error = {"error": {"code": 502, "message": "Injected stream error"}}
+                self._write_event(f"data: {json.dumps(error)}\n\n")
+                self._write_chunk(b"")
+                return
+        self._write_event(f"data: {json.dumps({'model': request.get('model'), 'choices': [], 'usage': usage})}\n\n")
+        self._write_event("data: [DONE]\n\n")
+        self._write_chunk(b"")
+
+def add_server_arguments(parser):
+    """Stand-in latency and failure options, shared by the benchmarks that start it"""
+    parser.add_argument("--first-token-delay", default="0.3",
+                        help="Seconds, or uniform:LOW:HIGH, normal:MEAN:STDDEV, lognormal:MEDIAN:SIGMA")
+    parser.add_argument("--token-rate", type=float, default=33, help="Streamed tokens per second")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests that fail")
+    parser.add_argument("--error-status", type=int, default=503, help="Status of injected failures (429 adds Retry-After)")
+    parser.add_argument("--stream-error-rate", type=float, default=0.0, help="Fraction of streams cut by an error event")
+    parser.add_argument("--upload-rate", type=float, default=0,
+                        help="Simulated uplink in bytes per second, e.g. 60000 for a poor cellular link (0 for none)")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for repeatable latency and errors")
+
+def server_config(args):
+    return {
+        "first_token_delay": args.first_token_delay,
+        "token_rate": args.token_rate,
+        "error_rate": args.error_rate,
+        "error_status": args.error_status,
+        "stream_error_rate": args.stream_error_rate,
+        "upload_rate": args.upload_rate,
+        "seed": args.seed
+    }
+
+def start_mock_server(port=0, **config):
+    """Start the stand-in on a background thread and return the server"""
+    server = MockOpenRouterServer(("127.0.0.1", port), **config)
+    threading.Thread(target=server.serve_forever, name="mock-openrouter", daemon=True).start()
+    return server
+
+def base_url(server):
+    return f"http://127.0.0.1:{server.server_address[1]}/api/v1"
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OpenRouter stand-in")
+    parser.add_argument("--port", type=int, default=8080)
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    server = MockOpenRouterServer(("127.0.0.1", args.port), **server_config(args))
+    print(f"Mock OpenRouter listening on {base_url(server)}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
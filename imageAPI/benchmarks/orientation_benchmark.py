@@ -0,0 +1,85 @@
+"""Accuracy and latency of the on-device orientation estimator.
+
+Run from the imageAPI directory:
+
+    python -m benchmarks.orientation_benchmark /path/to/labeled
+
+The folder holds one sub-folder per label (0, 90, 180, 270) containing images
+that need that clockwise rotation to be upright. With --upright the folder is
+treated as upright photos and all four rotations are generated from each.
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+from image_derivatives import ImageDerivatives
+from orientation import estimate_orientation, ORIENTATION_CONFIDENCE_THRESHOLD
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+ANGLES = (0, 90, 180, 270)
+
+def list_images(folder):
+    return sorted(os.path.join(folder, name) for name in os.listdir(folder)
+                  if name.lower().endswith(IMAGE_EXTENSIONS))
+
+def labeled_samples(folder, upright):
+    """Yield (label, PIL image, decode seconds) for every benchmark frame"""
+    if upright:
+        for path in list_images(folder):
+            start_time = time.perf_counter()
+            thumbnail = ImageDerivatives(path).image(256)
+            decode_time = time.perf_counter() - start_time
+            for angle in ANGLES:
+                # PIL rotates counter-clockwise, so this frame needs a clockwise turn of `angle`
+                yield angle, thumbnail.rotate(angle, expand=True), decode_time
+        return
+
+    for angle in ANGLES:
+        label_folder = os.path.join(folder, str(angle))
+        if not os.path.isdir(label_folder):
+            continue
+        for path in list_images(label_folder):
+            start_time = time.perf_counter()
+            thumbnail = ImageDerivatives(path).image(256)
+            yield angle, thumbnail, time.perf_counter() - start_time
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the local orientation estimator")
+    parser.add_argument("folder", help="Folder of labeled (or upright) images")
+    parser.add_argument("--upright", action="store_true", help="Generate all four rotations from upright images")
+    parser.add_argument("--threshold", type=float, default=ORIENTATION_CONFIDENCE_THRESHOLD,
+                        help="Confidence below which the pipeline falls back to the remote call")
+    args = parser.parse_args()
+
+    results = []
+    for label, thumbnail, decode_time in labeled_samples(args.folder, args.upright):
+        start_time = time.perf_counter()
+        angle, confidence = estimate_orientation(thumbnail)
+        estimate_time = time.perf_counter() - start_time
+        results.append((label, angle, confidence, decode_time, estimate_time))
+
+    if not results:
+        print("No labeled images found")
+        sys.exit(1)
+
+    correct = np.array([label == angle for label, angle, _, _, _ in results])
+    confident = np.array([confidence >= args.threshold for _, _, confidence, _, _ in results])
+    decode_ms = np.array([r[3] for r in results]) * 1000
+    estimate_ms = np.array([r[4] for r in results]) * 1000
+
+    print(f"Frames:                  {len(results)}")
+    print(f"Accuracy (all frames):   {correct.mean() * 100:.1f}%")
+    print(f"Answered locally:        {confident.mean() * 100:.1f}% at confidence >= {args.threshold}")
+    if confident.any():
+        print(f"Accuracy (local only):   {correct[confident].mean() * 100:.1f}%")
+    for angle in ANGLES:
+        mask = np.array([label == angle for label, _, _, _, _ in results])
+        if mask.any():
+            print(f"  {angle:>3} deg accuracy:     {correct[mask].mean() * 100:.1f}% ({mask.sum()} frames)")
+    print(f"Thumbnail decode:        mean {decode_ms.mean():.2f} ms, p95 {np.percentile(decode_ms, 95):.2f} ms")
+    print(f"Estimate latency:        mean {estimate_ms.mean():.2f} ms, p95 {np.percentile(estimate_ms, 95):.2f} ms")
+
+if __name__ == "__main__":
+    main()
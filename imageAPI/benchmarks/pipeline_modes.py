@@ -0,0 +1,64 @@
+"""Latency and token usage of each pipeline mode on the same image.
+
+Run from the imageAPI directory, against OpenRouter (uses OPENAPI_KEY) or
+the local stand-in:
+
+    python -m benchmarks.pipeline_modes capture.jpg --runs 5
+    python -m benchmarks.pipeline_modes capture.jpg --mock
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import numpy as np
+
+from benchmarks.mock_openrouter import start_mock_server, base_url
+from benchmarks.fakes import FakeLCD
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare pipeline modes on one image")
+    parser.add_argument("image", help="JPEG capture to describe")
+    parser.add_argument("--runs", type=int, default=3, help="Runs per mode")
+    parser.add_argument("--modes", default="sequential,speculative,fast")
+    parser.add_argument("--mock", action="store_true", help="Use the local OpenRouter stand-in")
+    args = parser.parse_args()
+
+    if args.mock:
+        server = start_mock_server()
+        os.environ["OPENROUTER_BASE_URL"] = base_url(server)
+        os.environ.setdefault("OPENAPI_KEY", "mock-key")
+    # Rotated copies go to a scratch folder instead of the device's Pictures folder
+    os.environ["IMAGE_OUTPUT_DIR"] = tempfile.mkdtemp(prefix="pipeline_modes_")
+    os.makedirs(os.environ["IMAGE_OUTPUT_DIR"], exist_ok=True)
+
+    # Imported late so the environment above is picked up
+    import RaspBerryPiScript as script
+    import pipeline_metrics
+
+    script.lcd_display = FakeLCD()
+    results = {}
+    for mode in args.modes.split(","):
+        if mode not in script.PIPELINE_MODES:
+            print(f"Unknown mode: {mode}")
+            sys.exit(1)
+        for _ in range(args.runs):
+            metrics = pipeline_metrics.start_capture()
+            start_time = time.perf_counter()
+            script.describe_image(args.image, mode)
+            values = metrics.as_dict()["values"]
+            results.setdefault(mode, []).append((
+                time.perf_counter() - start_time,
+                values.get("prompt_tokens", 0),
+                values.get("completion_tokens", 0)
+            ))
+
+    print(f"{'mode':<12} {'p50 ms':>8} {'max ms':>8} {'prompt tok':>11} {'output tok':>11}")
+    for mode, runs in results.items():
+        latencies = np.array([run[0] for run in runs]) * 1000
+        print(f"{mode:<12} {np.percentile(latencies, 50):>8.0f} {latencies.max():>8.0f} "
+              f"{np.mean([run[1] for run in runs]):>11.0f} {np.mean([run[2] for run in runs]):>11.0f}")
+    script.api_client.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Time and output size of each way of making a capture upright.
+
+Run from the imageAPI directory:
+
+    python -m benchmarks.rotation_methods capture.jpg --runs 20
+    python -m benchmarks.rotation_methods --synthetic
+
+Every method rotates the same JPEG (by 90 degrees unless --rotation says otherwise); the saving per rotated
+capture is the re-encode time minus the method's time.
+"""
+import time
+import shutil
+import argparse
+import numpy as np
+
+from camera import SyntheticCamera
+from jpeg_rotation import rotate_jpeg, ROTATION_METHODS
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the rotation methods for saved captures")
+    parser.add_argument("image", nargs="?", default="", help="JPEG to rotate")
+    parser.add_argument("--synthetic", action="store_true", help="Use a 1920x1080 synthetic camera frame")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--rotation", type=int, choices=[90, 180, 270], default=90)
+    args = parser.parse_args()
+    if not args.image and not args.synthetic:
+        parser.error("give an image or --synthetic")
+
+    if args.synthetic:
+        jpeg_bytes = SyntheticCamera("balanced").capture()
+    else:
+        with open(args.image, "rb") as image_file:
+            jpeg_bytes = image_file.read()
+    print(f"Input {len(jpeg_bytes) / 1024:.0f} KB, rotating by {args.rotation} degrees, {args.runs} runs")
+
+    results = {}
+    for method in ROTATION_METHODS:
+        if method == "lossless" and not shutil.which("jpegtran"):
+            print("lossless: skipped, jpegtran not installed")
+            continue
+        timings = []
+        for _ in range(args.runs):
+            start_time = time.perf_counter()
+            output, _ = rotate_jpeg(jpeg_bytes, args.rotation, method)
+            timings.append(time.perf_counter() - start_time)
+        results[method] = (np.percentile(timings, 50) * 1000, len(output))
+
+    baseline = results["reencode"][0]
+    print(f"{'method':<12} {'p50 ms':>9} {'size KB':>9} {'saved ms':>9}")
+    for method, (p50, size) in results.items():
+        print(f"{method:<12} {p50:>9.2f} {size / 1024:>9.0f} {baseline - p50:>9.1f}")
+
+if __name__ == "__main__":
+    main()
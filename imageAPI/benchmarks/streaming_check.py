@@ -0,0 +1,45 @@
+"""Stream a completion from the local stand-in through the real client and renderer.
+
+Run from the imageAPI directory:
+
+    python -m benchmarks.streaming_check
+"""
+import sys
+import time
+import argparse
+
+from openrouter_client import OpenRouterClient
+from progressive_text import ProgressiveTextRenderer, stream_to_display
+from benchmarks.mock_openrouter import DEFAULT_REPLY, start_mock_server, base_url
+
+def main():
+    parser = argparse.ArgumentParser(description="Check SSE streaming against the local stand-in")
+    parser.add_argument("--fps", type=float, default=4)
+    parser.add_argument("--token-delay", type=float, default=0.03)
+    parser.add_argument("--split-bytes", type=int, default=7, help="Split SSE events into pieces of this size")
+    args = parser.parse_args()
+
+    server = start_mock_server(token_delay=args.token_delay, split_bytes=args.split_bytes)
+    client = OpenRouterClient("test-key", base_url=base_url(server), keepalive_interval=0)
+
+    frames = []
+    renderer = ProgressiveTextRenderer(lambda text: frames.append((time.monotonic(), text)), args.fps)
+    data = {"model": "mock/model", "messages": [{"role": "user", "content": "Describe the product"}]}
+    start_time = time.monotonic()
+    text, first_text_time = stream_to_display(client.chat_completion_stream(data), renderer)
+    total_time = time.monotonic() - start_time
+
+    client.close()
+    server.shutdown()
+
+    intervals = [later[0] - earlier[0] for earlier, later in zip(frames, frames[1:])]
+    print(f"Time to first text: {first_text_time * 1000:.0f} ms")
+    print(f"Total stream time:  {total_time * 1000:.0f} ms")
+    print(f"LCD frames:         {len(frames)} (min interval {min(intervals, default=0) * 1000:.0f} ms)")
+    if text != DEFAULT_REPLY or frames[-1][1] != DEFAULT_REPLY:
+        print("FAILED: streamed text does not match the stand-in reply")
+        sys.exit(1)
+    print("OK")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Encode time against upload size for each codec Pillow can write here.
+
+Run from the imageAPI directory (on the Pi, for its CPU timings):
+
+    python -m benchmarks.upload_codecs capture.jpg --runs 10
+    python -m benchmarks.upload_codecs --synthetic --rates 20000,100000,1000000
+
+The analysis derivative is encoded with every codec at the stage quality, then
+encode plus transfer time is worked out for each link rate to show which codec
+UPLOAD_CODEC=auto should settle on.
+"""
+import time
+import argparse
+import numpy as np
+
+from camera import SyntheticCamera
+from image_derivatives import ImageDerivatives, STAGE_SETTINGS
+from upload_encoder import available_codecs, encode
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the upload codecs")
+    parser.add_argument("image", nargs="?", default="", help="JPEG to encode")
+    parser.add_argument("--synthetic", action="store_true", help="Use a shaky 1920x1080 synthetic camera frame")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--stage", default="analysis", choices=sorted(STAGE_SETTINGS), help="Derivative to encode")
+    parser.add_argument("--rates", default="25000,100000,500000,2000000",
+                        help="Comma-separated uplink rates in bytes per second")
+    args = parser.parse_args()
+    if not args.image and not args.synthetic:
+        parser.error("give an image or --synthetic")
+
+    source = SyntheticCamera(shake=True).capture() if args.synthetic else args.image
+    settings = STAGE_SETTINGS[args.stage]
+    image = ImageDerivatives(source).stage_image(args.stage)
+    print(f"{args.stage} derivative {image.size[0]}x{image.size[1]} at quality {settings['quality']}, {args.runs} runs")
+
+    results = {}
+    for codec in available_codecs():
+        timings = []
+        for _ in range(args.runs):
+            start_time = time.perf_counter()
+            encoded = encode(image, settings["quality"], codec)
+            timings.append(time.perf_counter() - start_time)
+        results[codec] = (float(np.percentile(timings, 50)), len(encoded))
+
+    print(f"{'codec':<6} {'encode ms':>10} {'size KB':>9}")
+    for codec, (seconds, size) in results.items():
+        print(f"{codec:<6} {seconds * 1000:>10.1f} {size / 1024:>9.1f}")
+
+    print()
+    print(f"{'link KB/s':>10} " + " ".join(f"{codec + ' ms':>10}" for codec in results) + "  best")
+    for rate in (float(rate) for rate in args.rates.split(",")):
+        # Base64 turns 3 bytes into 4 on the wire
+        totals = {codec: seconds + size * 4 / 3 / rate for codec, (seconds, size) in results.items()}
+        best = min(totals, key=totals.get)
+        print(f"{rate / 1000:>10.0f} " + " ".join(f"{total * 1000:>10.0f}" for total in totals.values()) + f"  {best}")
+
+if __name__ == "__main__":
+    main()
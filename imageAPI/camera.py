@@ -0,0 +1,544 @@
+import io
+import os
+import json
+import time
+import logging
+import threading
+import tempfile
+import subprocess
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+
+# picamera2 is optional; without it captures fall back to one libcamera-still process per press
+try:
+    from picamera2 import Picamera2
+except ImportError:
+    Picamera2 = None
+
+logger = logging.getLogger(__name__)
+
+# "auto" keeps a warm picamera2 stream when picamera2 is installed and spawns libcamera-still otherwise.
+# "file" replays saved images and "synthetic" draws test frames (benchmarks, development off the Pi)
+CAMERA_BACKEND = os.getenv("CAMERA_BACKEND", "auto")
+CAMERA_FILE = os.getenv("CAMERA_FILE", "")
+CAMERA_FILE_DELAY = float(os.getenv("CAMERA_FILE_DELAY", "0"))
+CAMERA_FRAME_RATE = float(os.getenv("CAMERA_FRAME_RATE", "30"))
+CAMERA_JPEG_QUALITY = int(os.getenv("CAMERA_JPEG_QUALITY", "90"))
+# Scene brightness of the synthetic camera (1.0 is a normal scene), lower it to exercise the quality gate
+SYNTHETIC_BRIGHTNESS = float(os.getenv("SYNTHETIC_BRIGHTNESS", "1.0"))
+
+# Capture profile, see CAPTURE_PROFILES
+CAPTURE_PROFILE = os.getenv("CAPTURE_PROFILE", "balanced")
+# Reuse the last converged exposure and white balance while the scene's lux stays within this fraction of it
+EXPOSURE_REUSE_TOLERANCE = float(os.getenv("EXPOSURE_REUSE_TOLERANCE", "0.25"))
+# libcamera-still sensor mode for binned profiles, e.g. 2028:1520:12:P on the HQ camera (empty lets libcamera pick)
+CAMERA_BINNED_MODE = os.getenv("CAMERA_BINNED_MODE", "")
+# libcamera-still's per-shot metadata file lives in RAM (/tmp is on the SD card on Raspberry Pi OS)
+CAMERA_METADATA_DIR = os.getenv("CAMERA_METADATA_DIR", "/dev/shm")
+
+# size None means the full sensor resolution. converge_ms is how long libcamera-still
+# lets auto-exposure settle when there is no reusable exposure (its default is 5 s)
+CAPTURE_PROFILES = {
+    "fast": {"size": (1280, 720), "quality": 80, "binned": True, "reuse_exposure": True, "converge_ms": 300},
+    "balanced": {"size": (1920, 1080), "quality": CAMERA_JPEG_QUALITY, "binned": True, "reuse_exposure": True,
+                 "converge_ms": 1000},
+    "detail": {"size": None, "quality": 95, "binned": False, "reuse_exposure": False, "converge_ms": 2000}
+}
+
+# Zero shutter lag: keep the last ZSL_FRAMES full-resolution frames and return the sharpest on a press
+ZERO_SHUTTER_LAG = os.getenv("ZERO_SHUTTER_LAG", "0") == "1"
+ZSL_FRAMES = int(os.getenv("ZSL_FRAMES", "4"))
+# Sharpness is scored on every ZSL_SCORE_STEP-th pixel in each direction
+ZSL_SCORE_STEP = int(os.getenv("ZSL_SCORE_STEP", "4"))
+# Frame intervals a press waits for a recent frame before capturing from the camera directly
+ZSL_WAIT_FRAMES = int(os.getenv("ZSL_WAIT_FRAMES", "3"))
+# Frames older than the ring's span plus this many intervals are stale (the stream has stalled)
+ZSL_STALE_FRAMES = int(os.getenv("ZSL_STALE_FRAMES", "2"))
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg")
+
+class CameraBackend:
+    """Interface shared by every camera: start(), capture() -> JPEG bytes, close()
+
+    shutter_lag is the time between the last capture() call and the moment its frame
+    was available, reported in the capture metrics.
+    """
+
+    shutter_lag = 0.0
+    # Whether capture_adjusted() really changes the exposure
+    adjustable = False
+
+    def start(self):
+        """Open the camera ahead of the first capture (a no-op for cold backends)"""
+
+    def capture(self):
+        raise NotImplementedError
+
+    def capture_adjusted(self, ev_offset=0.0, shutter_scale=1.0):
+        """Re-shoot with exposure moved by ev_offset stops and the shutter scaled (gain makes up for it)
+
+        Both are relative to the camera's own auto-exposure, not to the previous adjusted shot.
+        """
+        return self.capture()
+
+    def close(self):
+        pass
+
+def capture_profile(name=None):
+    name = name or CAPTURE_PROFILE
+    if name not in CAPTURE_PROFILES:
+        raise ValueError(f"Unknown capture profile: {name}")
+    return CAPTURE_PROFILES[name]
+
+def exposure_settings(metadata):
+    """Exposure, gain, white balance and lux from libcamera frame metadata, None if any is missing"""
+    try:
+        return {
+            "exposure_time": int(metadata["ExposureTime"]),
+            "analogue_gain": float(metadata["AnalogueGain"]),
+            "colour_gains": tuple(metadata["ColourGains"]),
+            "lux": float(metadata["Lux"])
+        }
+    except (KeyError, TypeError, ValueError):
+        return None
+
+def adjusted_exposure(settings, ev_offset, shutter_scale):
+    """Exposure time and gain for an EV offset and shutter scale, keeping the overall exposure otherwise"""
+    exposure_time = max(1, int(settings["exposure_time"] * 2 ** ev_offset * shutter_scale))
+    return exposure_time, settings["analogue_gain"] / shutter_scale
+
+class ExposureCache:
+    """Exposure time, gain and white balance of the last converged shot, with the lux it was measured at"""
+
+    def __init__(self, tolerance=EXPOSURE_REUSE_TOLERANCE):
+        self.tolerance = tolerance
+        self.settings = None
+
+    def update(self, metadata):
+        self.settings = exposure_settings(metadata)
+
+    def matches(self, lux):
+        """Whether a shot taken with the cached settings saw about the same scene brightness"""
+        if self.settings is None or lux is None:
+            return False
+        reference = max(self.settings["lux"], 1.0)
+        return abs(lux - self.settings["lux"]) / reference <= self.tolerance
+
+    def invalidate(self):
+        self.settings = None
+
+def laplacian_variance(frame, step=ZSL_SCORE_STEP):
+    """Sharpness of an RGB frame: variance of the 4-neighbour Laplacian of its luma"""
+    sample = frame[::step, ::step].astype(np.float32)
+    luma = sample[..., 0] * 0.299 + sample[..., 1] * 0.587 + sample[..., 2] * 0.114
+    laplacian = (luma[:-2, 1:-1] + luma[2:, 1:-1] + luma[1:-1, :-2] + luma[1:-1, 2:]
+                 - 4.0 * luma[1:-1, 1:-1])
+    return float(laplacian.var())
+
+class LibcameraStillCamera(CameraBackend):
+    """Runs libcamera-still once per capture
+
+    After a converged shot the next ones skip the preview (--immediate) with its exposure,
+    gain and white balance, and fall back to converging again if the lux moved too far.
+    """
+
+    adjustable = True
+
+    def __init__(self, profile=None, ev=0.5):
+        self.profile = capture_profile(profile)
+        self.ev = ev
+        self.exposure_cache = ExposureCache()
+        # Metadata of the last unadjusted shot, the reference for capture_adjusted()
+        self._last_settings = None
+        # stdout already carries the JPEG, so the metadata needs a file; fall back to /tmp off Linux
+        metadata_dir = CAMERA_METADATA_DIR if os.path.isdir(CAMERA_METADATA_DIR) else None
+        metadata_fd, self._metadata_path = tempfile.mkstemp(prefix="libcamera_", suffix=".json", dir=metadata_dir)
+        os.close(metadata_fd)
+
+    def _shoot(self, settings, ev=None):
+        """One libcamera-still run, returns the JPEG bytes and the frame metadata"""
+        capture_cmd = [
+            "libcamera-still",
+            "-o", "-",
+            "--ev", str(self.ev if ev is None else ev),
+            "-q", str(self.profile["quality"]),
+            "--metadata", self._metadata_path,
+            "--metadata-format", "json"
+        ]
+        if self.profile["size"]:
+            capture_cmd += ["--width", str(self.profile["size"][0]), "--height", str(self.profile["size"][1])]
+        if self.profile["binned"] and CAMERA_BINNED_MODE:
+            capture_cmd += ["--mode", CAMERA_BINNED_MODE]
+        if settings:
+            red_gain, blue_gain = settings["colour_gains"]
+            capture_cmd += [
+                "--immediate",
+                "--shutter", str(settings["exposure_time"]),
+                "--gain", str(settings["analogue_gain"]),
+                "--awbgains", f"{red_gain},{blue_gain}"
+            ]
+        else:
+            capture_cmd += ["-t", str(self.profile["converge_ms"])]
+        jpeg_bytes = subprocess.run(capture_cmd, check=True, stdout=subprocess.PIPE).stdout
+        try:
+            with open(self._metadata_path, "r") as metadata_file:
+                metadata = json.load(metadata_file)
+        except (OSError, ValueError):
+            metadata = {}
+        return jpeg_bytes, metadata
+
+    def capture(self):
+        """Shoot a JPEG and return its bytes, read from libcamera-still's stdout instead of a file"""
+        start_time = time.monotonic()
+        settings = self.exposure_cache.settings if self.profile["reuse_exposure"] else None
+        jpeg_bytes, metadata = self._shoot(settings)
+        if settings and not self.exposure_cache.matches(metadata.get("Lux")):
+            logger.info(f"Scene brightness changed ({settings['lux']:.0f} -> {metadata.get('Lux')} lux), "
+                        f"converging exposure again")
+            self.exposure_cache.invalidate()
+            settings = None
+            jpeg_bytes, metadata = self._shoot(None)
+        if not settings:
+            self.exposure_cache.update(metadata)
+        self._last_settings = exposure_settings(metadata)
+        # Camera open, sensor setup, AE/AWB convergence and the preview timeout all count as lag
+        self.shutter_lag = time.monotonic() - start_time
+        return jpeg_bytes
+
+    def capture_adjusted(self, ev_offset=0.0, shutter_scale=1.0):
+        start_time = time.monotonic()
+        if self._last_settings is None:
+            # Nothing to scale from: let auto-exposure converge at the shifted EV
+            jpeg_bytes, _ = self._shoot(None, ev=self.ev + ev_offset)
+        else:
+            exposure_time, analogue_gain = adjusted_exposure(self._last_settings, ev_offset, shutter_scale)
+            jpeg_bytes, _ = self._shoot(dict(self._last_settings, exposure_time=exposure_time,
+                                             analogue_gain=analogue_gain))
+        self.shutter_lag = time.monotonic() - start_time
+        return jpeg_bytes
+
+    def close(self):
+        try:
+            os.remove(self._metadata_path)
+        except OSError:
+            pass
+
+class Picamera2Camera(CameraBackend):
+    """Keeps the sensor streaming so a still is the next frame, not a fresh camera start
+
+    Auto-exposure and white balance keep running on the stream, so there is nothing to
+    reuse between shots: every capture is already converged.
+    """
+
+    adjustable = True
+    # Frames to wait for manual exposure to take effect
+    SETTLE_FRAMES = 6
+
+    def __init__(self, profile=None, ev=0.5):
+        self.profile = capture_profile(profile)
+        self.quality = self.profile["quality"]
+        self.ev = ev
+        self._camera = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._camera is not None:
+                return
+            start_time = time.monotonic()
+            camera = Picamera2()
+            size = tuple(self.profile["size"] or camera.sensor_resolution)
+            # RGB888 frames are laid out B, G, R in memory
+            camera.configure(camera.create_still_configuration(
+                main={"size": size, "format": "RGB888"}, raw={"size": self._sensor_mode_size(camera, size)},
+                buffer_count=2))
+            camera.set_controls({"ExposureValue": self.ev})
+            camera.options["quality"] = self.quality
+            camera.start()
+            self._camera = camera
+            logger.info(f"Camera streaming after {(time.monotonic() - start_time) * 1000:.0f} ms")
+
+    def _sensor_mode_size(self, camera, size):
+        """Binned profiles use the smallest sensor mode that covers the output size, others the full sensor"""
+        modes = sorted(camera.sensor_modes, key=lambda mode: mode["size"][0] * mode["size"][1])
+        if self.profile["binned"]:
+            for mode in modes:
+                if mode["size"][0] >= size[0] and mode["size"][1] >= size[1]:
+                    return mode["size"]
+        return modes[-1]["size"]
+
+    def capture(self):
+        self.start()
+        with self._lock:
+            start_time = time.monotonic()
+            # Blocks until the next completed frame, at most one frame interval away
+            request = self._camera.capture_request()
+            try:
+                self.shutter_lag = time.monotonic() - start_time
+                buffer = io.BytesIO()
+                request.save("main", buffer, format="jpeg")
+            finally:
+                request.release()
+        return buffer.getvalue()
+
+    def capture_adjusted(self, ev_offset=0.0, shutter_scale=1.0):
+        self.start()
+        with self._lock:
+            start_time = time.monotonic()
+            settings = exposure_settings(self._camera.capture_metadata())
+            if settings is None:
+                self._camera.set_controls({"ExposureValue": self.ev + ev_offset})
+            else:
+                exposure_time, analogue_gain = adjusted_exposure(settings, ev_offset, shutter_scale)
+                self._camera.set_controls({"AeEnable": False, "ExposureTime": exposure_time,
+                                           "AnalogueGain": analogue_gain})
+            try:
+                for frame_number in range(self.SETTLE_FRAMES):
+                    request = self._camera.capture_request()
+                    if frame_number == self.SETTLE_FRAMES - 1:
+                        break
+                    if settings is not None:
+                        frame_exposure = request.get_metadata().get("ExposureTime", 0)
+                        if abs(frame_exposure - exposure_time) <= exposure_time * 0.05:
+                            break
+                    request.release()
+                self.shutter_lag = time.monotonic() - start_time
+                buffer = io.BytesIO()
+                try:
+                    request.save("main", buffer, format="jpeg")
+                finally:
+                    request.release()
+            finally:
+                # Back to auto-exposure for the next shot
+                self._camera.set_controls({"AeEnable": True, "ExposureValue": self.ev})
+        return buffer.getvalue()
+
+    def capture_frame(self):
+        """Next frame of the stream as an RGB array (used by the zero-shutter-lag ring buffer)"""
+        self.start()
+        return self._camera.capture_array("main")[..., ::-1]
+
+    def close(self):
+        with self._lock:
+            if self._camera is not None:
+                self._camera.stop()
+                self._camera.close()
+                self._camera = None
+
+class FileCamera(CameraBackend):
+    """Stand-in camera that returns a saved JPEG, or cycles through a folder of them"""
+
+    def __init__(self, source, delay=0.0):
+        if os.path.isdir(source):
+            self.files = sorted(os.path.join(source, name) for name in os.listdir(source)
+                                if name.lower().endswith(IMAGE_EXTENSIONS))
+        else:
+            self.files = [source]
+        if not self.files or not os.path.exists(self.files[0]):
+            raise ValueError(f"No images for the file camera at {source!r}")
+        # Simulated exposure and readout time
+        self.delay = delay
+        self._next_index = 0
+
+    def capture(self):
+        time.sleep(self.delay)
+        self.shutter_lag = self.delay
+        source_path = self.files[self._next_index % len(self.files)]
+        self._next_index += 1
+        with open(source_path, "rb") as image_file:
+            return image_file.read()
+
+class SyntheticCamera(CameraBackend):
+    """Stand-in warm camera: draws a product-like test frame on the next tick of a simulated stream
+
+    With shake set, frames get a random blur like a hand-held camera. brightness scales the
+    scene, and capture_adjusted() brightens it by the EV offset and cuts blur with a faster shutter.
+    """
+
+    adjustable = True
+
+    def __init__(self, profile=None, frame_rate=CAMERA_FRAME_RATE, shake=False, brightness=SYNTHETIC_BRIGHTNESS):
+        profile = capture_profile(profile)
+        # Full resolution of the 12 MP HQ camera for the detail profile
+        self.width, self.height = profile["size"] or (4056, 3040)
+        self.frame_interval = 1.0 / frame_rate
+        self.quality = profile["quality"]
+        self.shake = shake
+        self.brightness = brightness
+        self.frames_captured = 0
+        self._stream_start = time.monotonic()
+        self._rng = np.random.default_rng()
+
+    def start(self):
+        self._stream_start = time.monotonic()
+
+    def _next_frame(self, ev_offset=0.0, shutter_scale=1.0):
+        """Wait for the next frame boundary, like a sensor that is already streaming, and draw it"""
+        elapsed = time.monotonic() - self._stream_start
+        time.sleep(self.frame_interval - elapsed % self.frame_interval)
+        return self._draw_frame(self.brightness * 2 ** ev_offset, shutter_scale)
+
+    def capture(self):
+        return self.capture_adjusted()
+
+    def capture_adjusted(self, ev_offset=0.0, shutter_scale=1.0):
+        start_time = time.monotonic()
+        frame = self._next_frame(ev_offset, shutter_scale)
+        self.shutter_lag = time.monotonic() - start_time
+        buffer = io.BytesIO()
+        frame.save(buffer, format="JPEG", quality=self.quality)
+        return buffer.getvalue()
+
+    def capture_frame(self):
+        return np.asarray(self._next_frame())
+
+    def _draw_frame(self, brightness=1.0, shutter_scale=1.0):
+        self.frames_captured += 1
+        frame = Image.new("RGB", (self.width, self.height), (200, 205, 210))
+        draw = ImageDraw.Draw(frame)
+        # Bright sky above a darker floor, and a box with label lines in the middle
+        draw.rectangle((0, self.height * 2 // 3, self.width, self.height), fill=(90, 80, 70))
+        offset = (self.frames_captured % 10) * self.width // 100
+        left, top = self.width // 3 + offset, self.height // 4
+        draw.rectangle((left, top, left + self.width // 3, top + self.height // 2), fill=(180, 40, 40))
+        for line in range(4):
+            y = top + self.height // 10 + line * self.height // 16
+            draw.rectangle((left + 40, y, left + self.width // 3 - 40, y + self.height // 40), fill=(250, 250, 250))
+        if self.shake:
+            frame = frame.filter(ImageFilter.BoxBlur(float(self._rng.uniform(0, 6)) * shutter_scale))
+        if brightness != 1.0:
+            frame = frame.point(lambda value: min(255, int(value * brightness)))
+        return frame
+
+class ZeroShutterLagCamera(CameraBackend):
+    """Ring buffer of the last frames of a streaming camera; a press returns the sharpest one taken before it
+
+    The ring is allocated once, from the first frame's shape, so memory stays at
+    frame_count full-resolution frames.
+    """
+
+    def __init__(self, source, frame_count=ZSL_FRAMES):
+        self.source = source
+        self.frame_count = max(1, frame_count)
+        self.quality = source.quality
+        self._ring = None
+        self._scores = np.zeros(self.frame_count)
+        self._timestamps = np.zeros(self.frame_count)
+        self._filled = 0
+        self._next_slot = 0
+        # Time between ring updates, starts at the stream's frame interval and follows the measured one
+        self._frame_interval = getattr(source, "frame_interval", 1.0 / CAMERA_FRAME_RATE)
+        self._lock = threading.Lock()
+        self._frame_arrived = threading.Condition(self._lock)
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self.source.start()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._fill_ring, name="zsl-ring", daemon=True)
+        self._thread.start()
+
+    def _fill_ring(self):
+        last_arrival = None
+        while not self._stop_event.is_set():
+            try:
+                frame = self.source.capture_frame()
+            except Exception as e:
+                logger.error(f"Zero-shutter-lag stream failed: {e}")
+                last_arrival = None
+                self._stop_event.wait(1)
+                continue
+            # Stamped on arrival, before scoring, so it is comparable with the press time
+            arrived_at = time.monotonic()
+            score = laplacian_variance(frame)
+            with self._lock:
+                if self._ring is None:
+                    self._ring = np.empty((self.frame_count,) + frame.shape, dtype=frame.dtype)
+                    logger.info(f"Zero-shutter-lag ring: {self.frame_count} frames, {self._ring.nbytes / 2 ** 20:.0f} MB")
+                if last_arrival is not None:
+                    self._frame_interval = 0.8 * self._frame_interval + 0.2 * (arrived_at - last_arrival)
+                slot = self._next_slot
+                np.copyto(self._ring[slot], frame)
+                self._scores[slot] = score
+                self._timestamps[slot] = arrived_at
+                self._next_slot = (slot + 1) % self.frame_count
+                self._filled = min(self._filled + 1, self.frame_count)
+                self._frame_arrived.notify_all()
+            last_arrival = arrived_at
+
+    def _fresh_slots(self, press_time):
+        """Slots of frames young enough for a press at press_time: the ring's span plus ZSL_STALE_FRAMES intervals"""
+        max_age = self._frame_interval * (self.frame_count + ZSL_STALE_FRAMES)
+        return np.flatnonzero(self._timestamps[:self._filled] >= press_time - max_age)
+
+    def capture(self):
+        self.start()
+        start_time = time.monotonic()
+        # Only the copy is made under the lock, the stream keeps filling the ring while we encode
+        with self._lock:
+            # A stalled or failing stream must not hang the button, wait a few frame intervals at most
+            fresh = self._frame_arrived.wait_for(lambda: len(self._fresh_slots(start_time)),
+                                                 timeout=self._frame_interval * ZSL_WAIT_FRAMES)
+            if fresh:
+                candidates = self._fresh_slots(start_time)
+                timestamps = self._timestamps[candidates]
+                before_press = candidates[timestamps <= start_time]
+                if not len(before_press):
+                    # The ring had nothing recent at the press, take the first frame that arrived after it
+                    before_press = candidates[[np.argmin(timestamps)]]
+                scores = self._scores[before_press]
+                slot = int(before_press[np.argmax(scores)])
+                frame = self._ring[slot].copy()
+                frame_age = start_time - self._timestamps[slot]
+            waited = time.monotonic() - start_time
+        if not fresh:
+            logger.warning(f"Zero-shutter-lag ring has no recent frame after {waited * 1000:.0f} ms, "
+                           f"capturing from the camera directly")
+            jpeg_bytes = self.source.capture()
+            self.shutter_lag = waited + self.source.shutter_lag
+            return jpeg_bytes
+        self.shutter_lag = waited
+        when = f"{frame_age * 1000:.0f} ms before" if frame_age >= 0 else f"{-frame_age * 1000:.0f} ms after"
+        logger.info(f"Picked frame {when} the press, sharpness {scores.max():.0f} of {len(scores)} frames "
+                    f"(range {scores.min():.0f}-{scores.max():.0f})")
+        buffer = io.BytesIO()
+        Image.fromarray(frame).save(buffer, format="JPEG", quality=self.quality)
+        return buffer.getvalue()
+
+    def close(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+        self.source.close()
+
+def create_camera(backend=None, zero_shutter_lag=None, profile=None):
+    """Build the configured camera backend, wrapped in the ring buffer when zero shutter lag is on"""
+    backend = backend or CAMERA_BACKEND
+    profile = profile or CAPTURE_PROFILE
+    capture_profile(profile)
+    zero_shutter_lag = ZERO_SHUTTER_LAG if zero_shutter_lag is None else zero_shutter_lag
+    if backend == "auto":
+        backend = "picamera2" if Picamera2 is not None else "libcamera"
+    if backend == "picamera2":
+        if Picamera2 is None:
+            raise ValueError("CAMERA_BACKEND=picamera2 needs the picamera2 package")
+        camera = Picamera2Camera(profile)
+    elif backend == "libcamera":
+        camera = LibcameraStillCamera(profile)
+    elif backend == "file":
+        camera = FileCamera(CAMERA_FILE, CAMERA_FILE_DELAY)
+    elif backend == "synthetic":
+        camera = SyntheticCamera(profile, shake=zero_shutter_lag)
+    else:
+        raise ValueError(f"Unknown camera backend: {backend}")
+
+    if zero_shutter_lag:
+        if not hasattr(camera, "capture_frame"):
+            logger.warning(f"Zero shutter lag needs a streaming camera, {backend} captures on demand")
+            return camera
+        return ZeroShutterLagCamera(camera)
+    return camera
@@ -0,0 +1,97 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Number of recent descriptions kept for the LCD history view
+CAPTURE_HISTORY_SIZE = int(os.getenv("CAPTURE_HISTORY_SIZE", "50"))
+
+class CaptureHistory:
+    """Recent descriptions, newest first, appended to a JSON-lines file so they survive restarts
+
+    Once the file holds twice as many lines as are kept it is rewritten with only the
+    kept entries, and the saved images of the dropped ones are deleted, so neither
+    the file nor the history image directory grows without bound.
+    """
+
+    def __init__(self, path, size=CAPTURE_HISTORY_SIZE):
+        self.path = path
+        self._entries = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self._dropped = []  # Entries pushed out since the last compaction, their images go with it
+        self._lines = 0  # Lines in the file, compacted once it reaches twice the kept size
+
+        history_dir = os.path.dirname(path)
+        if history_dir:
+            os.makedirs(history_dir, exist_ok=True)
+        if os.path.exists(path):
+            dropped = []
+            with open(path, "r", encoding="utf-8") as history_file:
+                for line in history_file:
+                    self._lines += 1
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Torn last line after a crash
+                        continue
+                    if self._entries and len(self._entries) == self._entries.maxlen:
+                        dropped.append(self._entries[-1])
+                    self._entries.appendleft(entry)
+            if self._lines > len(self._entries):
+                self._compact(dropped)
+
+    def add(self, description, captured_at=None, source="live", image=None, rotation=0):
+        entry = {"captured_at": captured_at or time.time(), "source": source, "description": description}
+        if image:
+            entry["image"] = image
+        if rotation:
+            # Clockwise rotation still needed to show the saved image upright
+            entry["rotation"] = rotation
+        with self._lock:
+            dropped = [self._entries[-1]] if self._entries and len(self._entries) == self._entries.maxlen else []
+            self._entries.appendleft(entry)
+            self._dropped.extend(dropped)
+            try:
+                with open(self.path, "a", encoding="utf-8") as history_file:
+                    history_file.write(json.dumps(entry) + "\n")
+                self._lines += 1
+            except OSError as e:
+                logger.error(f"Could not write capture history: {e}")
+            if self._lines >= 2 * max(1, self._entries.maxlen):
+                self._compact(self._dropped)
+        return entry
+
+    def _compact(self, dropped):
+        """Rewrite the file with only the kept entries (atomic rename) and delete the dropped images"""
+        temp_path = self.path + ".tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as history_file:
+                for entry in reversed(self._entries):
+                    history_file.write(json.dumps(entry) + "\n")
+                history_file.flush()
+                os.fsync(history_file.fileno())
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            logger.error(f"Could not compact capture history: {e}")
+            return
+        self._lines = len(self._entries)
+        kept_images = {entry.get("image") for entry in self._entries}
+        for entry in dropped:
+            image = entry.get("image")
+            if image and image not in kept_images:
+                try:
+                    os.remove(image)
+                except OSError:
+                    pass
+        self._dropped = []
+
+    def entries(self):
+        with self._lock:
+            return list(self._entries)
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,266 @@
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Queue settings (overridable from the .env file)
+CAPTURE_QUEUE_ENABLED = os.getenv("CAPTURE_QUEUE", "1") == "1"
+QUEUE_CONCURRENCY = int(os.getenv("QUEUE_CONCURRENCY", "2"))
+QUEUE_POLL_INTERVAL = float(os.getenv("QUEUE_POLL_INTERVAL", "15"))
+QUEUE_MAX_ATTEMPTS = int(os.getenv("QUEUE_MAX_ATTEMPTS", "5"))
+
+JOURNAL_NAME = "journal.jsonl"
+
+def _fsync_dir(path):
+    """Make a rename or new file in a directory durable"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+class CaptureQueue:
+    """Durable queue of captures taken while offline
+
+    Every change is one JSON line appended to a journal and fsynced before the call
+    returns, so a crash loses at most the line being written. Replaying the journal
+    on start-up rebuilds the pending jobs; a torn last line is cut off and a corrupt
+    line elsewhere is skipped so the records after it still count.
+    """
+
+    def __init__(self, queue_dir, max_attempts=QUEUE_MAX_ATTEMPTS):
+        self.queue_dir = queue_dir
+        self.max_attempts = max_attempts
+        self.journal_path = os.path.join(queue_dir, JOURNAL_NAME)
+        self._jobs = {}  # id -> job, in enqueue order
+        self._lock = threading.Lock()
+
+        os.makedirs(queue_dir, exist_ok=True)
+        finished, corrupt = self._replay()
+        if finished or corrupt:
+            self._compact()
+        self._journal = open(self.journal_path, "a", encoding="utf-8")
+        if self._jobs:
+            logger.info(f"Capture queue restored {len(self._jobs)} pending captures")
+
+    def _replay(self):
+        """Rebuild pending jobs from the journal, returns how many finished jobs and corrupt lines it holds"""
+        if not os.path.exists(self.journal_path):
+            return 0, 0
+        finished = 0
+        corrupt = 0
+        valid_length = 0
+        with open(self.journal_path, "rb") as journal:
+            lines = journal.readlines()
+        for number, line in enumerate(lines, 1):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            if not line.endswith(b"\n") or not isinstance(record, dict):
+                if number == len(lines):
+                    # Only the last line can be torn by a crash, it is cut off below
+                    break
+                corrupt += 1
+                logger.warning(f"Capture queue journal line {number} is corrupt, skipping it")
+                valid_length += len(line)
+                continue
+            valid_length += len(line)
+            op = record.get("op")
+            if op == "enqueue":
+                # Journals written before multi-shot groups hold one "image" per job
+                images = record.get("images") or [record["image"]]
+                self._jobs[record["id"]] = {"id": record["id"], "images": images,
+                                            "captured_at": record["captured_at"], "attempts": 0}
+            elif op == "attempt" and record["id"] in self._jobs:
+                self._jobs[record["id"]]["attempts"] += 1
+            elif op in ("done", "failed") and self._jobs.pop(record["id"], None) is not None:
+                finished += 1
+
+        if valid_length < os.path.getsize(self.journal_path):
+            # Torn write from a crash, drop it so new records start on a clean line
+            logger.warning("Capture queue journal ends in a partial record, truncating it")
+            with open(self.journal_path, "r+b") as journal:
+                journal.truncate(valid_length)
+                os.fsync(journal.fileno())
+        return finished, corrupt
+
+    def _compact(self):
+        """Rewrite the journal with only the pending jobs (atomic rename)"""
+        temp_path = self.journal_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as journal:
+            for job in self._jobs.values():
+                journal.write(json.dumps({"op": "enqueue", "id": job["id"], "images": job["images"],
+                                          "captured_at": job["captured_at"]}) + "\n")
+                for _ in range(job["attempts"]):
+                    journal.write(json.dumps({"op": "attempt", "id": job["id"]}) + "\n")
+            journal.flush()
+            os.fsync(journal.fileno())
+        os.replace(temp_path, self.journal_path)
+        _fsync_dir(self.queue_dir)
+
+    def _append(self, record):
+        self._journal.write(json.dumps(record) + "\n")
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+
+    def enqueue(self, jpeg_bytes, captured_at=None):
+        """Write an in-memory capture into the queue directory and journal it, returns the job
+
+        jpeg_bytes is one capture, or a list of the views of a multi-shot group that is
+        described as a single job.
+        """
+        job_id = uuid.uuid4().hex
+        views = jpeg_bytes if isinstance(jpeg_bytes, list) else [jpeg_bytes]
+        queued_paths = []
+        for view_number, view_bytes in enumerate(views):
+            file_name = f"{job_id}.jpg" if len(views) == 1 else f"{job_id}_{view_number}.jpg"
+            queued_path = os.path.join(self.queue_dir, file_name)
+            # Written under a temporary name so a crash never leaves a truncated image behind
+            temp_path = queued_path + ".tmp"
+            with open(temp_path, "wb") as image_file:
+                image_file.write(view_bytes)
+                image_file.flush()
+                os.fsync(image_file.fileno())
+            os.replace(temp_path, queued_path)
+            queued_paths.append(queued_path)
+        _fsync_dir(self.queue_dir)
+
+        job = {"id": job_id, "images": queued_paths, "captured_at": captured_at or time.time(), "attempts": 0}
+        with self._lock:
+            self._append({"op": "enqueue", "id": job_id, "images": queued_paths, "captured_at": job["captured_at"]})
+            self._jobs[job_id] = job
+        logger.info(f"Queued capture {job_id} ({len(self._jobs)} pending)")
+        return dict(job)
+
+    def pending(self):
+        """Pending jobs, oldest first"""
+        with self._lock:
+            return [dict(job) for job in self._jobs.values()]
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def record_attempt(self, job_id):
+        """Count a failed attempt, returns False once the job has run out of attempts"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return False
+            self._append({"op": "attempt", "id": job_id})
+            job["attempts"] += 1
+            if job["attempts"] < self.max_attempts:
+                return True
+        self._finish(job_id, "failed")
+        return False
+
+    def complete(self, job_id):
+        # The description goes to the capture history, the journal only needs to know the job is done
+        self._finish(job_id, "done")
+
+    def _finish(self, job_id, op):
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+            if job is None:
+                return
+            self._append({"op": op, "id": job_id})
+        for image_path in job["images"]:
+            try:
+                os.remove(image_path)
+            except OSError:
+                pass
+
+    def close(self):
+        with self._lock:
+            self._journal.close()
+
+class QueueWorker:
+    """Background thread that drains the capture queue whenever the endpoint is reachable
+
+    process(job) returns a description or raises; on_done(job, description) is called
+    for every success. is_online() is checked before each batch and after each failure.
+    """
+
+    def __init__(self, capture_queue, process, on_done, is_online, concurrency=QUEUE_CONCURRENCY,
+                 poll_interval=QUEUE_POLL_INTERVAL):
+        self.queue = capture_queue
+        self.process = process
+        self.on_done = on_done
+        self.is_online = is_online
+        self.concurrency = max(1, concurrency)
+        self.poll_interval = poll_interval
+        self.offline = False
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="capture-queue", daemon=True)
+        self._thread.start()
+
+    def wake(self):
+        """Check the queue now instead of at the next poll"""
+        self._wake_event.set()
+
+    def mark_offline(self):
+        self.offline = True
+
+    def _run(self):
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="queue-job") as executor:
+            while not self._stop_event.is_set():
+                self._wake_event.wait(self.poll_interval)
+                self._wake_event.clear()
+                if self._stop_event.is_set():
+                    break
+                if not len(self.queue):
+                    continue
+                if not self.is_online():
+                    if not self.offline:
+                        logger.info(f"Endpoint unreachable, {len(self.queue)} captures stay queued")
+                    self.offline = True
+                    continue
+                self.offline = False
+                self._drain(executor)
+
+    def _drain(self, executor):
+        """Upload pending captures, at most concurrency at a time, until empty or offline"""
+        logger.info(f"Endpoint reachable, uploading {len(self.queue)} queued captures")
+        while not self._stop_event.is_set():
+            batch = self.queue.pending()[:self.concurrency]
+            if not batch:
+                return
+            futures = [(job, executor.submit(self.process, job)) for job in batch]
+            failed = False
+            for job, future in futures:
+                try:
+                    description = future.result()
+                except Exception as e:
+                    failed = True
+                    logger.error(f"Queued capture {job['id']} failed: {e}")
+                    if not self.queue.record_attempt(job["id"]):
+                        logger.error(f"Giving up on queued capture {job['id']} after {self.queue.max_attempts} attempts")
+                    continue
+                self.queue.complete(job["id"])
+                self.on_done(job, description)
+            if failed:
+                # Leave the rest for the next poll rather than burning attempts back to back
+                self.offline = not self.is_online()
+                return
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
@@ -0,0 +1,66 @@
+import os
+import numpy as np
+
+from camera import laplacian_variance
+
+# Local check of each frame before anything is uploaded (overridable from the .env file)
+QUALITY_GATE = os.getenv("QUALITY_GATE", "1") == "1"
+# Re-captures allowed per press; the last frame is used even if it still fails
+QUALITY_MAX_RETRIES = int(os.getenv("QUALITY_MAX_RETRIES", "2"))
+# Mean luma (0-255) outside this range is too dark or too bright
+QUALITY_MIN_BRIGHTNESS = float(os.getenv("QUALITY_MIN_BRIGHTNESS", "45"))
+QUALITY_MAX_BRIGHTNESS = float(os.getenv("QUALITY_MAX_BRIGHTNESS", "215"))
+# Largest fraction of pixels crushed to black or blown to white
+QUALITY_MAX_CLIPPED = float(os.getenv("QUALITY_MAX_CLIPPED", "0.3"))
+# Laplacian variance of the orientation-sized derivative below which the frame counts as blurred
+QUALITY_MIN_SHARPNESS = float(os.getenv("QUALITY_MIN_SHARPNESS", "20"))
+# Stops added or taken away per re-capture of a dark or bright frame
+QUALITY_EV_STEP = float(os.getenv("QUALITY_EV_STEP", "1.0"))
+
+# Luma levels counted as clipped at each end of the histogram
+CLIP_LEVELS = 8
+LUMA_WEIGHTS = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+class FrameQuality:
+    """Luma statistics of one frame and what, if anything, is wrong with it"""
+
+    def __init__(self, brightness, dark_clipped, bright_clipped, sharpness):
+        self.brightness = brightness
+        self.dark_clipped = dark_clipped
+        self.bright_clipped = bright_clipped
+        self.sharpness = sharpness
+        # Exposure comes first: dark frames also have little detail to measure sharpness on
+        if brightness < QUALITY_MIN_BRIGHTNESS or dark_clipped > QUALITY_MAX_CLIPPED:
+            self.problem = "too dark"
+        elif brightness > QUALITY_MAX_BRIGHTNESS or bright_clipped > QUALITY_MAX_CLIPPED:
+            self.problem = "too bright"
+        elif sharpness < QUALITY_MIN_SHARPNESS:
+            self.problem = "blurred"
+        else:
+            self.problem = None
+
+    def adjustment(self):
+        """(EV offset, shutter scale) to add for the next attempt"""
+        if self.problem == "too dark":
+            return QUALITY_EV_STEP, 1.0
+        if self.problem == "too bright":
+            return -QUALITY_EV_STEP, 1.0
+        if self.problem == "blurred":
+            # Half the shutter time, twice the gain
+            return 0.0, 0.5
+        return 0.0, 1.0
+
+    def __str__(self):
+        return (f"brightness {self.brightness:.0f}, clipped {self.dark_clipped:.0%} dark / "
+                f"{self.bright_clipped:.0%} bright, sharpness {self.sharpness:.0f}")
+
+def assess_frame(image):
+    """Score a small RGB derivative: luma histogram, clipping at both ends and Laplacian sharpness"""
+    rgb = np.asarray(image)
+    luma = (rgb.astype(np.float32) @ LUMA_WEIGHTS).astype(np.uint8)
+    histogram = np.bincount(luma.ravel(), minlength=256)
+    pixel_count = luma.size
+    brightness = float(histogram @ np.arange(256)) / pixel_count
+    dark_clipped = histogram[:CLIP_LEVELS].sum() / pixel_count
+    bright_clipped = histogram[-CLIP_LEVELS:].sum() / pixel_count
+    return FrameQuality(brightness, dark_clipped, bright_clipped, laplacian_variance(rgb, step=1))
@@ -0,0 +1,110 @@
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from latency_stats import RollingLatency
+from request_policy import CancelEvent
+
+logger = logging.getLogger(__name__)
+
+# Hedging settings (overridable from the .env file)
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "90"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "10"))
+HEDGE_DEFAULT_DELAY = float(os.getenv("HEDGE_DEFAULT_DELAY", "8"))
+
+class HedgeStats:
+    """Per-model latency window plus hedge rate and wins, used to tune the trigger"""
+
+    def __init__(self, percentile=HEDGE_PERCENTILE, min_samples=HEDGE_MIN_SAMPLES, default_delay=HEDGE_DEFAULT_DELAY):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.default_delay = default_delay
+        self.requests = 0
+        self.hedges = 0
+        self.wins = {}
+        self._latency = {}
+        self._lock = threading.Lock()
+
+    def latency(self, model):
+        with self._lock:
+            return self._latency.setdefault(model, RollingLatency())
+
+    def trigger_delay(self, model):
+        """How long to wait on a model before hedging: a percentile of its recent latency"""
+        latency = self.latency(model)
+        if len(latency) < self.min_samples:
+            return self.default_delay
+        return latency.percentile(self.percentile)
+
+    def record(self, winner, hedged):
+        with self._lock:
+            self.requests += 1
+            if hedged:
+                self.hedges += 1
+            self.wins[winner] = self.wins.get(winner, 0) + 1
+            hedge_rate = self.hedges / self.requests
+            wins = ", ".join(f"{model}={count}" for model, count in self.wins.items())
+        logger.info(f"Hedge stats: rate={hedge_rate * 100:.0f}% ({self.hedges}/{self.requests}) wins: {wins}")
+
+def hedged_call(primary, secondary, call, stats, discard=None):
+    """Run call(model, cancel_event) on the primary model and hedge to the secondary if it is slow
+
+    The first successful result wins. The loser's CancelEvent is set, which runs the
+    callbacks call registered on it (the client aborts the request's connection), and its
+    future is cancelled if it has not started; a loser that had already returned a result
+    is passed to discard so it can release what it holds. Every request gets its own
+    CancelEvent, so hedging a model with itself (a plain re-issue) is safe.
+    """
+    def timed_call(model, cancel_event):
+        start_time = time.monotonic()
+        result = call(model, cancel_event)
+        if not cancel_event.is_set():
+            stats.latency(model).add(time.monotonic() - start_time)
+        return result
+
+    def submit(model):
+        cancel_event = CancelEvent()
+        futures[executor.submit(timed_call, model, cancel_event)] = (model, cancel_event)
+
+    executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="hedge")
+    try:
+        futures = {}  # future -> (model, cancel event)
+        submit(primary)
+        hedged = False
+        trigger_at = time.monotonic() + stats.trigger_delay(primary)
+        last_error = None
+        while True:
+            timeout = None if hedged else max(0.0, trigger_at - time.monotonic())
+            done, pending = wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+
+            winner = next((future for future in done if future.exception() is None), None)
+            if winner is not None:
+                break
+            for future in done:
+                last_error = future.exception()
+                del futures[future]
+
+            if not hedged:
+                # Primary is slow (or already failed): fire the same request at the secondary
+                hedged = True
+                logger.info(f"Hedging {primary} with {secondary}")
+                submit(secondary)
+            elif not futures:
+                raise last_error
+
+        def release(future):
+            if future.exception() is None and future.result() is not None:
+                discard(future.result())
+
+        winning_model = futures[winner][0]
+        for future, (_, cancel_event) in futures.items():
+            if future is not winner:
+                cancel_event.set()
+                if not future.cancel() and discard is not None:
+                    future.add_done_callback(release)
+        stats.record(winning_model, hedged)
+        return winning_model, winner.result()
+    finally:
+        executor.shutdown(wait=False)
@@ -0,0 +1,193 @@
+import os
+import io
+import base64
+import logging
+import threading
+from PIL import Image
+
+import pipeline_metrics
+import upload_encoder
+from request_body import InlineImage
+
+logger = logging.getLogger(__name__)
+
+# Long edge (pixels) and JPEG quality of the image uploaded by each pipeline stage, and whether
+# it is cropped to the region of interest. A long edge of 0 uploads the original capture untouched.
+STAGE_SETTINGS = {
+    "orientation": {
+        "long_edge": int(os.getenv("ORIENTATION_LONG_EDGE", "256")),
+        "quality": int(os.getenv("ORIENTATION_JPEG_QUALITY", "70")),
+        "crop": False
+    },
+    "analysis": {
+        "long_edge": int(os.getenv("ANALYSIS_LONG_EDGE", "1024")),
+        "quality": int(os.getenv("ANALYSIS_JPEG_QUALITY", "85")),
+        "crop": True
+    }
+}
+
+class ImageDerivatives:
+    """Decode a capture once and serve stage-specific, pre-encoded downscaled copies
+
+    The capture is either a file path or the camera's JPEG bytes held in memory.
+    """
+
+    def __init__(self, source, stage_settings=None):
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            self.path = None
+            self._jpeg_bytes = source
+            self.name = f"in-memory capture ({len(source) / 1024:.0f} KB)"
+        else:
+            self.path = source
+            self._jpeg_bytes = None
+            self.name = source
+        self.stage_settings = stage_settings or STAGE_SETTINGS
+        self.rotation = 0
+        # Region of interest as fractions of the frame as shot (left, top, right, bottom)
+        self.crop = None
+        self._decoded = None
+        self._images = {}
+        self._encoded = {}
+        # Orientation and analysis may read derivatives from different threads
+        self._lock = threading.RLock()
+
+    def jpeg_bytes(self):
+        """The original JPEG, read from disk only when the capture came from a file"""
+        if self._jpeg_bytes is not None:
+            return self._jpeg_bytes
+        with open(self.path, "rb") as img_file:
+            return img_file.read()
+
+    def open_original(self):
+        """Open the full-resolution capture with PIL"""
+        if self._jpeg_bytes is not None:
+            return Image.open(io.BytesIO(self._jpeg_bytes))
+        return Image.open(self.path)
+
+    def _decode(self):
+        """Decode the JPEG once, letting libjpeg downscale by the largest usable factor"""
+        if self._decoded is not None:
+            return self._decoded
+
+        long_edges = [settings["long_edge"] for settings in self.stage_settings.values()]
+        with self.open_original() as source_img:
+            width, height = source_img.size
+            if long_edges and min(long_edges) > 0:
+                # draft() picks the smallest DCT scale that still covers the largest derivative
+                scale = max(long_edges) / max(width, height)
+                if scale < 1:
+                    source_img.draft("RGB", (int(width * scale), int(height * scale)))
+            self._decoded = source_img.convert("RGB")
+
+        logger.debug(f"Decoded {self.name} at {self._decoded.size[0]}x{self._decoded.size[1]}")
+        return self._decoded
+
+    def image(self, long_edge, cropped=False):
+        """Return the (rotated) decoded frame scaled so its long edge is at most long_edge
+
+        cropped cuts it down to the region of interest, at the scale the full frame would have.
+        """
+        with self._lock:
+            return self._image(long_edge, cropped)
+
+    def _image(self, long_edge, cropped=False):
+        cropped = cropped and self.crop is not None
+        if (long_edge, cropped) in self._images:
+            return self._images[(long_edge, cropped)]
+
+        derived_img = self._decode()
+        target_edge = long_edge
+        if cropped:
+            width, height = derived_img.size
+            left, top, right, bottom = self.crop
+            derived_img = derived_img.crop((round(left * width), round(top * height),
+                                            round(right * width), round(bottom * height)))
+            if long_edge > 0:
+                # Same pixel density as the full-frame derivative, so the upload shrinks with the crop
+                target_edge = max(1, round(long_edge * max(derived_img.size) / max(width, height)))
+        if target_edge > 0 and max(derived_img.size) > target_edge:
+            # Integer box reduction first, then a single resample to the exact size
+            factor = max(derived_img.size) // target_edge
+            if factor > 1:
+                derived_img = derived_img.reduce(factor)
+            scale = target_edge / max(derived_img.size)
+            if scale < 1:
+                new_size = (max(1, round(derived_img.size[0] * scale)), max(1, round(derived_img.size[1] * scale)))
+                derived_img = derived_img.resize(new_size, Image.BILINEAR)
+
+        if self.rotation:
+            derived_img = derived_img.rotate(-self.rotation, expand=True)  # Negative because PIL rotates counter-clockwise
+
+        self._images[(long_edge, cropped)] = derived_img
+        return derived_img
+
+    def stage_image(self, stage):
+        """Return the decoded derivative sized (and cropped) for a stage"""
+        settings = self.stage_settings[stage]
+        return self.image(settings["long_edge"], settings.get("crop", False))
+
+    def data_url(self, stage, accepted=("jpeg",)):
+        """Return the upload for a stage as an image_url value that is spliced into the body without copies
+
+        accepted lists the codecs the receiving model(s) take; the upload uses one of them.
+        """
+        with self._lock:
+            encoded, codec = self._upload(stage, accepted)
+        return InlineImage(encoded, upload_encoder.CODECS[codec]["mime_type"])
+
+    def _upload(self, stage, accepted):
+        settings = self.stage_settings[stage]
+        cropped = settings.get("crop", False) and self.crop is not None
+        # The camera's JPEG goes out untouched when the stage asks for the original
+        passthrough = settings["long_edge"] <= 0 and not self.rotation and not cropped
+        with pipeline_metrics.stage("encode"):
+            if passthrough:
+                with self.open_original() as original_img:
+                    width, height = original_img.size
+            else:
+                width, height = self._image(settings["long_edge"], cropped).size
+            codec = upload_encoder.choose_codec(accepted, width * height)
+            if (stage, codec) in self._encoded:
+                return self._encoded[(stage, codec)], codec
+
+            # Only set once the uplink has been measured and adaptive uploads are on
+            budget = upload_encoder.byte_budget()
+            encoding = f"q{settings['quality']}"
+            if passthrough and codec == "jpeg" and (budget is None or len(self.jpeg_bytes()) <= budget):
+                encoded = self.jpeg_bytes()
+                encoding = "original"
+            elif budget is not None:
+                encoded, encoding = upload_encoder.encode_for_budget(
+                    self._image(settings["long_edge"], cropped), settings["quality"], budget, codec)
+            else:
+                encoded = upload_encoder.encode(self._image(settings["long_edge"], cropped), settings["quality"], codec,
+                                                record=True)
+
+            self._encoded[(stage, codec)] = base64.b64encode(encoded)
+        budget_note = f", budget {budget / 1024:.0f} KB" if budget is not None else ""
+        logger.info(f"Prepared {stage} upload: {len(encoded) / 1024:.0f} KB ({codec} {encoding}{budget_note})")
+        return self._encoded[(stage, codec)], codec
+
+    def set_rotation(self, rotation):
+        """Apply a clockwise rotation to every derivative produced from now on"""
+        with self._lock:
+            if rotation != self.rotation:
+                self.rotation = rotation
+                self._images.clear()
+                self._encoded.clear()
+
+    def set_crop(self, box):
+        """Crop the uploads of cropping stages to box (fractions of the frame as shot), None for the full frame"""
+        with self._lock:
+            if box != self.crop:
+                self.crop = box
+                # Uncropped images stay valid
+                self._images = {key: value for key, value in self._images.items() if not key[1]}
+                self._encoded = {key: value for key, value in self._encoded.items()
+                                 if not self.stage_settings[key[0]].get("crop", False)}
+
+def load_derivatives(image_source):
+    """Accept a file path, JPEG bytes or an existing ImageDerivatives"""
+    if isinstance(image_source, ImageDerivatives):
+        return image_source
+    return ImageDerivatives(image_source)
@@ -0,0 +1,102 @@
+import io
+import os
+import shutil
+import struct
+import logging
+import subprocess
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# How the full-resolution capture is made upright when it is written out (overridable from the .env file):
+#   exif        - keep the camera's JPEG and set its EXIF orientation tag, no decoding at all
+#   lossless    - jpegtran rotates the DCT blocks, no re-encode (falls back to exif without jpegtran)
+#   derivative  - keep the camera's JPEG as is, only the uploads are rotated (the history records the angle)
+#   reencode    - decode, rotate and encode again with Pillow
+ROTATION_METHOD = os.getenv("ROTATION_METHOD", "exif")
+ROTATION_METHODS = ["exif", "lossless", "derivative", "reencode"]
+REENCODE_JPEG_QUALITY = int(os.getenv("REENCODE_JPEG_QUALITY", "90"))
+
+EXIF_ORIENTATION_TAG = 0x0112
+# EXIF orientation that tells a viewer to turn the image clockwise by the key
+EXIF_ORIENTATIONS = {0: 1, 90: 6, 180: 3, 270: 8}
+EXIF_HEADER = b"Exif\x00\x00"
+# Markers without a length field
+STANDALONE_MARKERS = set(range(0xD0, 0xD8)) | {0x01}
+
+def _segments(jpeg_bytes):
+    """(marker, start, end) for each header segment up to the start of scan"""
+    position = 2
+    while position + 4 <= len(jpeg_bytes):
+        if jpeg_bytes[position] != 0xFF:
+            raise ValueError("Corrupt JPEG header")
+        marker = jpeg_bytes[position + 1]
+        if marker in STANDALONE_MARKERS:
+            yield marker, position, position + 2
+            position += 2
+            continue
+        length = struct.unpack(">H", jpeg_bytes[position + 2:position + 4])[0]
+        yield marker, position, position + 2 + length
+        if marker == 0xDA:
+            return
+        position += 2 + length
+
+def set_exif_orientation(jpeg_bytes, rotation):
+    """Return the JPEG with its EXIF orientation tag set for a clockwise rotation, image data untouched"""
+    with Image.open(io.BytesIO(jpeg_bytes)) as captured_img:
+        # Only the headers are parsed, the image is never decoded
+        exif = captured_img.getexif()
+    exif[EXIF_ORIENTATION_TAG] = EXIF_ORIENTATIONS[rotation]
+    exif_bytes = exif.tobytes()
+    if len(exif_bytes) + 2 > 0xFFFF:
+        raise ValueError("EXIF block too large for one APP1 segment")
+    app1 = b"\xff\xe1" + struct.pack(">H", len(exif_bytes) + 2) + exif_bytes
+
+    parts = [jpeg_bytes[:2]]
+    insert_at = 2
+    for marker, start, end in _segments(jpeg_bytes):
+        if marker == 0xE1 and jpeg_bytes[start + 4:start + 10] == EXIF_HEADER:
+            # Replaced by the new block
+            parts.append(jpeg_bytes[insert_at:start])
+            insert_at = end
+        elif marker == 0xE0 and start == insert_at == 2:
+            # Keep the JFIF header first
+            parts.append(jpeg_bytes[start:end])
+            insert_at = end
+    parts.append(app1)
+    parts.append(jpeg_bytes[insert_at:])
+    return b"".join(parts)
+
+def rotate_lossless(jpeg_bytes, rotation):
+    """Rotate with jpegtran, trimming partial edge blocks that cannot be moved losslessly"""
+    result = subprocess.run(["jpegtran", "-rotate", str(rotation), "-trim", "-copy", "all"],
+                            input=jpeg_bytes, stdout=subprocess.PIPE, check=True)
+    return set_exif_orientation(result.stdout, 0)
+
+def rotate_reencode(jpeg_bytes, rotation, quality=REENCODE_JPEG_QUALITY):
+    with Image.open(io.BytesIO(jpeg_bytes)) as captured_img:
+        # Negative because PIL rotates counter-clockwise
+        rotated_img = captured_img.rotate(-rotation, expand=True)
+    buffer = io.BytesIO()
+    rotated_img.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+def rotate_jpeg(jpeg_bytes, rotation, method=None):
+    """Make a JPEG upright by the configured method, returns the bytes and the method actually used"""
+    method = method or ROTATION_METHOD
+    if method not in ROTATION_METHODS:
+        raise ValueError(f"Unknown rotation method: {method}")
+    if rotation == 0 or method == "derivative":
+        return jpeg_bytes, method
+    if method == "lossless":
+        if shutil.which("jpegtran"):
+            return rotate_lossless(jpeg_bytes, rotation), method
+        logger.warning("jpegtran not found, setting the EXIF orientation instead")
+        method = "exif"
+    if method == "exif":
+        try:
+            return set_exif_orientation(jpeg_bytes, rotation), method
+        except ValueError as e:
+            logger.warning(f"Could not set the EXIF orientation ({e}), re-encoding instead")
+            method = "reencode"
+    return rotate_reencode(jpeg_bytes, rotation), method
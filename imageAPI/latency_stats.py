@@ -0,0 +1,24 @@
+import threading
+from collections import deque
+import numpy as np
+
+class RollingLatency:
+    """Samples (latencies, token rates) over a sliding window of recent requests"""
+
+    def __init__(self, window=100):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def percentile(self, percent):
+        """Latency percentile of the window, or None while it is empty"""
+        with self._lock:
+            if not self._samples:
+                return None
+            return float(np.percentile(self._samples, percent))
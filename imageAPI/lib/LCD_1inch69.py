@@ -151,41 +151,26 @@ class LCD_1inch69(lcdconfig.RaspberryPi):
         imwidth, imheight = Image.size
         if imwidth == self.height and imheight ==  self.width:
             print("Landscape screen")
-            img = self.np.asarray(Image)
-            pix = self.np.zeros((self.width, self.height,2), dtype = self.np.uint8)
-            #RGB888 >> RGB565
-            pix[...,[0]] = self.np.add(self.np.bitwise_and(img[...,[0]],0xF8),self.np.right_shift(img[...,[1]],5))
-            pix[...,[1]] = self.np.add(self.np.bitwise_and(self.np.left_shift(img[...,[1]],3),0xE0), self.np.right_shift(img[...,[2]],3))
-            pix = pix.flatten().tolist()
+            pix = self.rgb565(Image)
             
             self.command(0x36)
             self.data(0x70)
             self.SetWindows(0, 0, self.height,self.width, 1)
             self.digital_write(self.DC_PIN,True)
-            for i in range(0,len(pix),4096):
-                self.spi_writebyte(pix[i:i+4096])
         else :
             print("Portrait screen")
-            img = self.np.asarray(Image)
-            pix = self.np.zeros((imheight,imwidth , 2), dtype = self.np.uint8)
-            
-            pix[...,[0]] = self.np.add(self.np.bitwise_and(img[...,[0]],0xF8),self.np.right_shift(img[...,[1]],5))
-            pix[...,[1]] = self.np.add(self.np.bitwise_and(self.np.left_shift(img[...,[1]],3),0xE0), self.np.right_shift(img[...,[2]],3))
-            pix = pix.flatten().tolist()
-            
+            pix = self.rgb565(Image)
+
             self.command(0x36)
             self.data(0x00)
             self.SetWindows(0, 0, self.width, self.height, 0)
             self.digital_write(self.DC_PIN,True)
-        for i in range(0, len(pix), 4096):
-            self.spi_writebyte(pix[i: i+4096])
+        self.spi_writebuffer(pix)
         
 
     def clear(self):
         """Clear contents of image buffer"""
-        _buffer = [0xff] * (self.width*self.height*2)
         self.SetWindows(0, 0, self.width, self.height)
         self.digital_write(self.DC_PIN,True)
-        for i in range(0, len(_buffer), 4096):
-            self.spi_writebyte(_buffer[i: i+4096])
+        self.spi_writebuffer(self.fill_buffer(0xFFFF, self.width * self.height))
         
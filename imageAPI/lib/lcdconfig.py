@@ -51,6 +51,11 @@ class RaspberryPi:
         self.GPIO.setup(self.DC_PIN,    self.GPIO.OUT)
         self.GPIO.setup(self.BL_PIN,    self.GPIO.OUT)
         self.GPIO.output(self.BL_PIN,   self.GPIO.HIGH)        
+        # RGB565 frame buffer reused by every ShowImage, reallocated only when the frame size changes
+        self._rgb565 = None
+        self._rgb565_scratch = None
+        # Solid-colour frames for clear(), built once per colour and size
+        self._fill_buffers = {}
         #Initialize SPI
         self.SPI = spi
         if self.SPI!=None :
@@ -69,6 +74,47 @@ class RaspberryPi:
     def spi_writebyte(self, data):
         if self.SPI!=None :
             self.SPI.writebytes(data)
+
+    def spi_writebuffer(self, data):
+        """Write a bytes-like object (bytes, numpy array) without building a Python list
+
+        spidev's writebytes2 splits it into transfers of the driver's bufsiz (4096 bytes by
+        default; raise spidev.bufsiz on the kernel command line for fewer, larger ones).
+        """
+        if self.SPI==None :
+            return
+        if hasattr(self.SPI, "writebytes2"):
+            self.SPI.writebytes2(data)
+        else:
+            # spidev before 3.4
+            data = memoryview(data).cast("B")
+            for i in range(0,len(data),4096):
+                self.SPI.writebytes(list(data[i:i+4096]))
+
+    def fill_buffer(self, color, pixels):
+        """RGB565 bytes of pixels pixels of one colour, from the cache after the first call"""
+        key = (color, pixels)
+        if key not in self._fill_buffers:
+            self._fill_buffers[key] = bytes([color >> 8, color & 0xff]) * pixels
+        return self._fill_buffers[key]
+
+    def rgb565(self, image):
+        """Convert an RGB image to the panel's big-endian RGB565 in a reused buffer, returned as bytes"""
+        img = self.np.asarray(image)
+        shape = img.shape[:2]
+        if self._rgb565 is None or self._rgb565.shape != shape:
+            self._rgb565 = self.np.empty(shape, dtype=">u2")
+            self._rgb565_scratch = self.np.empty(shape, dtype=self.np.uint16)
+        pix, scratch = self._rgb565, self._rgb565_scratch
+        # RRRRRGGG GGGBBBBB, built in place from the 8-bit channels
+        self.np.bitwise_and(img[...,0], 0xF8, out=scratch, casting="unsafe")
+        self.np.left_shift(scratch, 8, out=pix)
+        self.np.bitwise_and(img[...,1], 0xFC, out=scratch, casting="unsafe")
+        self.np.left_shift(scratch, 3, out=scratch)
+        self.np.bitwise_or(pix, scratch, out=pix)
+        self.np.right_shift(img[...,2], 3, out=scratch, casting="unsafe")
+        self.np.bitwise_or(pix, scratch, out=pix)
+        return pix.view(self.np.uint8)
     def bl_DutyCycle(self, duty):
         self._pwm.ChangeDutyCycle(duty)
         
@@ -0,0 +1,167 @@
+import os
+import random
+import logging
+import threading
+from collections import deque
+
+from latency_stats import RollingLatency
+
+logger = logging.getLogger(__name__)
+
+# Router settings (overridable from the .env file)
+MODEL_ROUTING = os.getenv("MODEL_ROUTING", "1") == "1"
+ROUTER_WINDOW = int(os.getenv("ROUTER_WINDOW", "50"))
+ROUTER_MIN_SAMPLES = int(os.getenv("ROUTER_MIN_SAMPLES", "5"))
+ROUTER_MAX_ERROR_RATE = float(os.getenv("ROUTER_MAX_ERROR_RATE", "0.2"))
+ROUTER_EXPLORE_RATE = float(os.getenv("ROUTER_EXPLORE_RATE", "0.05"))
+
+# Relative answer quality of the models we know; a stage only routes to models at or above its minimum
+MODEL_QUALITY = {
+    "openai/gpt-4o-2024-08-06": 3,
+    "google/gemini-2.5-flash": 3,
+    "google/gemini-2.5-pro-preview-05-06": 4,
+    "google/gemini-2.5-pro": 4
+}
+
+# Upload codecs each model accepts besides JPEG; unknown models only get JPEG
+MODEL_IMAGE_CODECS = {
+    "openai/gpt-4o-2024-08-06": ["jpeg", "webp"],
+    "google/gemini-2.5-flash": ["jpeg", "webp"],
+    "google/gemini-2.5-pro-preview-05-06": ["jpeg", "webp"],
+    "google/gemini-2.5-pro": ["jpeg", "webp"]
+}
+
+def accepted_codecs(*models):
+    """Codecs every one of the models accepts (a hedged request may go to either)"""
+    accepted = None
+    for model in models:
+        codecs = set(MODEL_IMAGE_CODECS.get(model, ["jpeg"]))
+        accepted = codecs if accepted is None else accepted & codecs
+    return tuple(sorted(accepted or {"jpeg"}))
+
+def _stage_setting(prefix, stage, default):
+    return os.getenv(f"{prefix}_{stage.upper()}", default)
+
+def _model_list(stage, default):
+    return [model.strip() for model in _stage_setting("ROUTER_MODELS", stage, ",".join(default)).split(",") if model.strip()]
+
+# Candidate models per stage, the first one is used until the others have been measured
+STAGE_MODELS = {
+    "orientation": _model_list("orientation", ["openai/gpt-4o-2024-08-06", "google/gemini-2.5-flash"]),
+    "analysis": _model_list("analysis", ["google/gemini-2.5-pro-preview-05-06", "google/gemini-2.5-pro"]),
+    "description": _model_list("description", ["google/gemini-2.5-pro", "google/gemini-2.5-pro-preview-05-06"]),
+    "fast": _model_list("fast", ["google/gemini-2.5-pro-preview-05-06", "google/gemini-2.5-pro"])
+}
+STAGE_MIN_QUALITY = {
+    "orientation": int(_stage_setting("ROUTER_MIN_QUALITY", "orientation", "3")),
+    "analysis": int(_stage_setting("ROUTER_MIN_QUALITY", "analysis", "4")),
+    "description": int(_stage_setting("ROUTER_MIN_QUALITY", "description", "4")),
+    "fast": int(_stage_setting("ROUTER_MIN_QUALITY", "fast", "4"))
+}
+
+# OpenRouter provider sort per stage: short replies care about latency, long ones about throughput
+STAGE_PROVIDER_SORT = {
+    "orientation": _stage_setting("ROUTER_PROVIDER_SORT", "orientation", "latency"),
+    "analysis": _stage_setting("ROUTER_PROVIDER_SORT", "analysis", "throughput"),
+    "description": _stage_setting("ROUTER_PROVIDER_SORT", "description", "throughput"),
+    "fast": _stage_setting("ROUTER_PROVIDER_SORT", "fast", "latency")
+}
+
+class ModelStats:
+    """Rolling latency, error rate and tokens-per-second of one model on one stage"""
+
+    def __init__(self, window=ROUTER_WINDOW):
+        self.latency = RollingLatency(window)
+        self.tokens_per_second = RollingLatency(window)
+        self._outcomes = deque(maxlen=window)
+
+    def add(self, seconds, ok, completion_tokens=None):
+        self._outcomes.append(ok)
+        if not ok:
+            return
+        self.latency.add(seconds)
+        if completion_tokens and seconds > 0:
+            self.tokens_per_second.add(completion_tokens / seconds)
+
+    @property
+    def samples(self):
+        return len(self._outcomes)
+
+    def error_rate(self):
+        if not self._outcomes:
+            return 0.0
+        return self._outcomes.count(False) / len(self._outcomes)
+
+    def describe(self):
+        p50 = self.latency.percentile(50)
+        p95 = self.latency.percentile(95)
+        tps = self.tokens_per_second.percentile(50)
+        if p50 is None:
+            return f"n={self.samples} err={self.error_rate() * 100:.0f}%"
+        tps_text = f" {tps:.0f} tok/s" if tps is not None else ""
+        return f"n={self.samples} p50={p50:.2f}s p95={p95:.2f}s err={self.error_rate() * 100:.0f}%{tps_text}"
+
+class ModelRouter:
+    """Pick the fastest model for each stage among those that meet its quality bar"""
+
+    def __init__(self, stage_models=None, min_quality=None, enabled=MODEL_ROUTING, min_samples=ROUTER_MIN_SAMPLES,
+                 max_error_rate=ROUTER_MAX_ERROR_RATE, explore_rate=ROUTER_EXPLORE_RATE):
+        self.stage_models = stage_models or STAGE_MODELS
+        self.min_quality = min_quality or STAGE_MIN_QUALITY
+        self.enabled = enabled
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        self.explore_rate = explore_rate
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def stats(self, stage, model):
+        with self._lock:
+            return self._stats.setdefault((stage, model), ModelStats())
+
+    def candidates(self, stage):
+        """Models configured for a stage that meet its quality bar (unknown models are trusted)"""
+        minimum = self.min_quality.get(stage, 0)
+        return [model for model in self.stage_models[stage] if MODEL_QUALITY.get(model, minimum) >= minimum]
+
+    def select(self, stage):
+        """Model to use for the next request of a stage"""
+        candidates = self.candidates(stage)
+        if not candidates:
+            raise ValueError(f"No model for stage {stage} meets quality {self.min_quality.get(stage)}")
+        if not self.enabled or len(candidates) == 1:
+            return candidates[0]
+
+        stats = {model: self.stats(stage, model) for model in candidates}
+        unmeasured = [model for model in candidates if stats[model].samples < self.min_samples]
+        healthy = [model for model in candidates
+                   if model not in unmeasured and stats[model].error_rate() <= self.max_error_rate]
+
+        if unmeasured:
+            # Measure every candidate before trusting the comparison
+            model, reason = unmeasured[0], "measuring"
+        elif random.random() < self.explore_rate:
+            # Occasionally re-measure the others so a recovered model can win again
+            model, reason = random.choice(candidates), "exploring"
+        elif healthy:
+            model, reason = min(healthy, key=lambda m: stats[m].latency.percentile(50)), "fastest p50"
+        else:
+            model, reason = min(candidates, key=lambda m: stats[m].error_rate()), "fewest errors"
+
+        summary = "; ".join(f"{m}: {stats[m].describe()}" for m in candidates)
+        logger.info(f"Routing {stage} to {model} ({reason}) - {summary}")
+        return model
+
+    def provider_preferences(self, stage):
+        """OpenRouter provider routing fields for a stage"""
+        sort = STAGE_PROVIDER_SORT.get(stage)
+        if not self.enabled or not sort:
+            return {}
+        return {"sort": sort}
+
+    def record(self, stage, model, seconds, ok, usage=None):
+        """Add the outcome of one request to the model's rolling statistics"""
+        if stage not in self.stage_models or not model:
+            return
+        completion_tokens = (usage or {}).get("completion_tokens")
+        self.stats(stage, model).add(seconds, ok, completion_tokens)
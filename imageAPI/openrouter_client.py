@@ -0,0 +1,315 @@
+import os
+import time
+import socket
+import logging
+import functools
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+
+from sse import iter_completion_deltas
+from request_body import encode_json_body, TimedBody
+from request_policy import RequestPolicy, DeadlineExceeded, RequestCancelled, RETRYABLE_STATUS_CODES
+
+# httpx is optional; it is only needed for HTTP/2 multiplexing
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+logger = logging.getLogger(__name__)
+
+# Network failures that are worth retrying
+TRANSIENT_ERRORS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+if httpx is not None:
+    TRANSIENT_ERRORS += (httpx.TransportError,)
+
+# Connection settings (overridable from the .env file)
+OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1").rstrip("/")
+OPENROUTER_POOL_SIZE = int(os.getenv("OPENROUTER_POOL_SIZE", "4"))
+OPENROUTER_HTTP2 = os.getenv("OPENROUTER_HTTP2", "0") == "1"
+OPENROUTER_KEEPALIVE_INTERVAL = float(os.getenv("OPENROUTER_KEEPALIVE_INTERVAL", "30"))
+
+# Unsent bytes a pooled socket may buffer before a write blocks. Keeps the timed body write
+# close to when the last byte actually leaves; data in flight is not limited (Linux only)
+UPLOAD_NOTSENT_LOWAT = 4096
+
+class OpenRouterError(Exception):
+    """Non-200 response (or in-stream error event) from OpenRouter"""
+
+    def __init__(self, status_code, message):
+        super().__init__(f"{status_code} - {message}")
+        self.status_code = status_code
+        self.message = message
+
+class UploadTimingAdapter(HTTPAdapter):
+    """Pool adapter whose sockets hold little unsent data, so upload timing sees the link"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        if hasattr(socket, "TCP_NOTSENT_LOWAT"):
+            kwargs["socket_options"] = HTTPConnection.default_socket_options + [
+                (socket.IPPROTO_TCP, socket.TCP_NOTSENT_LOWAT, UPLOAD_NOTSENT_LOWAT)
+            ]
+        super().init_poolmanager(*args, **kwargs)
+
+class OpenRouterClient:
+    """Keep-alive connection pool shared by every OpenRouter request"""
+
+    def __init__(self, api_key, base_url=OPENROUTER_BASE_URL, pool_size=OPENROUTER_POOL_SIZE,
+                 http2=OPENROUTER_HTTP2, keepalive_interval=OPENROUTER_KEEPALIVE_INTERVAL, policy=None, on_result=None,
+                 on_upload=None):
+        self.base_url = base_url
+        self.policy = policy or RequestPolicy()
+        # on_result(stage, model, seconds, ok, usage) is told how every completion went
+        self.on_result = on_result
+        # on_upload(body_bytes, seconds) gets the time each request body took to write to the socket
+        self.on_upload = on_upload
+        self.keepalive_interval = keepalive_interval
+        self.http2 = False
+        self._last_activity = 0.0
+        self._stop_event = threading.Event()
+        self._keepalive_thread = None
+
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {api_key}"
+        }
+
+        if http2:
+            if httpx is None:
+                logger.warning("OPENROUTER_HTTP2 is set but httpx is not installed, using HTTP/1.1")
+            else:
+                try:
+                    limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+                    self._session = httpx.Client(http2=True, headers=headers, limits=limits, timeout=None)
+                    self.http2 = True
+                except ImportError:
+                    # httpx raises ImportError when the h2 package is missing
+                    logger.warning("HTTP/2 support requires the h2 package, using HTTP/1.1")
+
+        if not self.http2:
+            self._session = requests.Session()
+            self._session.headers.update(headers)
+            adapter = UploadTimingAdapter(pool_connections=1, pool_maxsize=pool_size)
+            self._session.mount("https://", adapter)
+            self._session.mount("http://", adapter)
+
+    def url(self, path):
+        """Build a full API URL from a path such as /chat/completions"""
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def _timeout(self, stage, deadline):
+        connect_timeout, read_timeout = self.policy.timeout(stage, deadline)
+        if self.http2:
+            return httpx.Timeout(read_timeout, connect=connect_timeout)
+        return (connect_timeout, read_timeout)
+
+    def _open(self, upload, stream, timeout):
+        """Send one pre-encoded chat-completion request (a TimedBody), leaving the response unread when streaming"""
+        url = self.url("/chat/completions")
+        if self.http2:
+            # HTTP/2 flow control paces the blocks; without TCP_NOTSENT_LOWAT the timing is looser
+            request = self._session.build_request("POST", url, content=upload.blocks(), timeout=timeout,
+                                                  headers={"Content-Length": str(len(upload))})
+            response = self._session.send(request, stream=stream)
+            if stream and response.status_code != 200:
+                response.read()
+            return response
+        return self._session.post(url, data=upload, stream=stream, timeout=timeout)
+
+    def abort(self, response):
+        """Drop the connection under a response from any thread, waking a read blocked on it"""
+        if not self.http2:
+            # close() alone leaves a blocked read waiting for the next bytes; a shutdown wakes it
+            sock = getattr(getattr(response.raw, "connection", None), "sock", None)
+            if sock is not None:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+        # On HTTP/2 closing resets just this stream, the shared connection stays up
+        response.close()
+
+    def _read_cancellable(self, response, cancel_event):
+        """Read a response opened with stream=True in full, aborting it as soon as cancel_event is set"""
+        abort = functools.partial(self.abort, response)
+        cancel_event.add_callback(abort)
+        try:
+            if self.http2:
+                response.read()
+            else:
+                response.content
+        except Exception as e:
+            if cancel_event.is_set():
+                raise RequestCancelled("Request cancelled while reading the response") from e
+            raise
+        finally:
+            cancel_event.remove_callback(abort)
+
+    def _send_with_retries(self, payload, stream, stage, deadline, cancel_event=None):
+        """Send a request under the policy: timeouts, jittered backoff and Retry-After"""
+        label = stage or "request"
+        # Encoded once; retries resend the same bytes
+        body = encode_json_body(payload)
+        attempt = 0
+        while True:
+            if cancel_event is not None and cancel_event.is_set():
+                raise RequestCancelled(f"OpenRouter {label} request cancelled")
+            self._last_activity = time.monotonic()
+            upload = TimedBody(body)
+            try:
+                response = self._open(upload, stream, self._timeout(stage, deadline))
+            except TRANSIENT_ERRORS as e:
+                delay = self.policy.next_delay(attempt, deadline)
+                if delay is None:
+                    raise
+                logger.warning(f"OpenRouter {label} request failed ({e}), retry {attempt + 1} in {delay:.1f}s")
+            else:
+                # Every request that got its whole body out is a bandwidth sample, streamed or not
+                upload_seconds = upload.seconds()
+                if upload_seconds is not None and self.on_upload is not None:
+                    self.on_upload(len(body), upload_seconds)
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    return response
+                delay = self.policy.next_delay(attempt, deadline, response.headers.get("Retry-After"))
+                if delay is None:
+                    return response
+                logger.warning(f"OpenRouter {label} request returned {response.status_code}, retry {attempt + 1} in {delay:.1f}s")
+                response.close()
+            finally:
+                self._last_activity = time.monotonic()
+            time.sleep(delay)
+            attempt += 1
+
+    def _report(self, stage, data, start_time, ok, usage=None):
+        if self.on_result is not None:
+            self.on_result(stage, data.get("model"), time.monotonic() - start_time, ok, usage)
+
+    def chat_completion(self, data, stage=None, deadline=None, cancel_event=None):
+        """Send a chat-completion request and return the final response after any retries
+
+        With a CancelEvent the body is read as a stream, so setting the event drops the
+        connection mid-reply instead of letting it finish (and be billed) unseen.
+        """
+        start_time = time.monotonic()
+        try:
+            response = self._send_with_retries(data, cancel_event is not None, stage, deadline, cancel_event)
+            if cancel_event is not None:
+                self._read_cancellable(response, cancel_event)
+        except TRANSIENT_ERRORS:
+            self._report(stage, data, start_time, False)
+            raise
+        usage = None
+        if response.status_code == 200 and self.on_result is not None:
+            try:
+                usage = response.json().get("usage")
+            except ValueError:
+                pass
+        self._report(stage, data, start_time, response.status_code == 200, usage)
+        return response
+
+    def chat_completion_stream(self, data, on_usage=None, stage=None, deadline=None, cancel_event=None):
+        """Stream a chat completion, yielding text deltas as they arrive
+
+        Setting cancel_event drops the connection, even while waiting for the next delta.
+        """
+        payload = dict(data, stream=True)
+        payload.setdefault("usage", {"include": True})
+        start_time = time.monotonic()
+        usage = {}
+
+        def collect_usage(stream_usage):
+            usage.update(stream_usage)
+            if on_usage is not None:
+                on_usage(stream_usage)
+
+        # Retries are only possible until the first token has been handed out
+        try:
+            response = self._send_with_retries(payload, True, stage, deadline, cancel_event)
+        except TRANSIENT_ERRORS:
+            self._report(stage, data, start_time, False)
+            raise
+        abort = functools.partial(self.abort, response)
+        if cancel_event is not None:
+            cancel_event.add_callback(abort)
+        try:
+            if response.status_code != 200:
+                raise OpenRouterError(response.status_code, response.text)
+            if self.http2:
+                chunks = response.iter_bytes()
+            else:
+                # chunk_size=None hands over data as soon as it is read from the socket
+                chunks = response.iter_content(chunk_size=None)
+            for delta in iter_completion_deltas(chunks, OpenRouterError, collect_usage):
+                if deadline is not None and deadline.expired():
+                    raise DeadlineExceeded(f"Capture deadline exceeded while streaming {stage or 'response'}")
+                yield delta
+            self._report(stage, data, start_time, True, usage)
+        except Exception as e:
+            # Only failures count against the model; streams closed early (hedge losers)
+            # or cut off by the deadline are not reported at all
+            if cancel_event is not None and cancel_event.is_set():
+                raise RequestCancelled(f"OpenRouter {stage or 'response'} stream cancelled") from e
+            if isinstance(e, (OpenRouterError,) + TRANSIENT_ERRORS):
+                self._report(stage, data, start_time, False)
+            raise
+        finally:
+            if cancel_event is not None:
+                cancel_event.remove_callback(abort)
+            response.close()
+            self._last_activity = time.monotonic()
+
+    def _ping(self):
+        """Send a bodyless request and return its round-trip time in seconds"""
+        start_time = time.monotonic()
+        # Any response keeps the socket in the pool, the status is irrelevant
+        self._session.head(self.url("/models"), timeout=10)
+        self._last_activity = time.monotonic()
+        return self._last_activity - start_time
+
+    def warm_up(self):
+        """Open the connection (DNS, TCP, TLS) before the first real request"""
+        try:
+            elapsed = self._ping()
+            logger.info(f"OpenRouter connection warmed up in {elapsed * 1000:.0f} ms")
+            return True
+        except Exception as e:
+            logger.warning(f"OpenRouter warm-up failed: {str(e)}")
+            return False
+
+    def is_reachable(self):
+        """True when the API answers at all, used to tell being offline from a failed request"""
+        try:
+            self._ping()
+            return True
+        except Exception as e:
+            logger.debug(f"OpenRouter unreachable: {str(e)}")
+            return False
+
+    def start_keepalive(self):
+        """Warm the pool and ping it while idle so the connection is never cold"""
+        if self._keepalive_thread is not None or self.keepalive_interval <= 0:
+            return
+        self._stop_event.clear()
+        self._keepalive_thread = threading.Thread(target=self._keepalive_loop, name="openrouter-keepalive", daemon=True)
+        self._keepalive_thread.start()
+
+    def _keepalive_loop(self):
+        self.warm_up()
+        while not self._stop_event.wait(self.keepalive_interval / 2):
+            idle_time = time.monotonic() - self._last_activity
+            if idle_time >= self.keepalive_interval:
+                try:
+                    elapsed = self._ping()
+                    logger.debug(f"Keep-alive ping after {idle_time:.0f}s idle took {elapsed * 1000:.0f} ms")
+                except Exception as e:
+                    logger.debug(f"Keep-alive ping failed: {str(e)}")
+
+    def close(self):
+        """Stop the keep-alive thread and release pooled connections"""
+        self._stop_event.set()
+        if self._keepalive_thread is not None:
+            self._keepalive_thread.join(timeout=1)
+            self._keepalive_thread = None
+        self._session.close()
@@ -0,0 +1,98 @@
+import os
+import time
+import logging
+import numpy as np
+
+from image_derivatives import load_derivatives
+
+logger = logging.getLogger(__name__)
+
+# "remote" always asks the vision model, "local" never does, and "hybrid"
+# only falls back to the vision model when the local estimate is unsure
+ORIENTATION_ENGINE = os.getenv("ORIENTATION_ENGINE", "hybrid")
+ORIENTATION_CONFIDENCE_THRESHOLD = float(os.getenv("ORIENTATION_CONFIDENCE_THRESHOLD", "0.6"))
+
+# Size of the grayscale frame the heuristics run on
+ESTIMATOR_SIZE = 128
+
+# Weights of the two cues that decide between the upright (0/180) and sideways (90/270) axis
+TEXT_LINE_WEIGHT = 0.7
+EDGE_DIRECTION_WEIGHT = 0.3
+
+# Scores at which each cue counts as fully confident
+AXIS_SCORE_SCALE = 0.3
+LUMINANCE_DIFF_SCALE = 0.15
+
+def _profile_variation(profile):
+    """Line-to-line variation of a projection profile relative to its mean"""
+    mean = profile.mean()
+    if mean < 1e-6:
+        return 0.0
+    return float(np.abs(np.diff(profile)).mean() / mean)
+
+def _balance(a, b):
+    """Signed balance in [-1, 1] between two non-negative quantities"""
+    total = a + b
+    if total < 1e-6:
+        return 0.0
+    return float((a - b) / total)
+
+def estimate_orientation(image):
+    """Estimate the clockwise rotation that makes a PIL image upright, returns (angle, confidence)"""
+    gray_img = image.convert("L")
+    gray_img.thumbnail((ESTIMATOR_SIZE, ESTIMATOR_SIZE))
+    gray = np.asarray(gray_img, dtype=np.float32) / 255.0
+
+    # Gradient magnitudes: horizontal edges show up in gy, vertical edges in gx
+    gx = np.abs(np.diff(gray, axis=1))[:-1, :]
+    gy = np.abs(np.diff(gray, axis=0))[:, :-1]
+    edge_energy = gx + gy
+
+    # Text-line projection profiles: lines of text make the row profile alternate
+    # between ink and gaps while the column profile stays flat (and vice versa when sideways)
+    text_score = _balance(_profile_variation(edge_energy.mean(axis=1)),
+                          _profile_variation(edge_energy.mean(axis=0)))
+
+    # Edge-direction histogram: upright scenes are dominated by horizontal structure
+    edge_score = _balance(float(gy.sum()), float(gx.sum()))
+
+    axis_score = TEXT_LINE_WEIGHT * text_score + EDGE_DIRECTION_WEIGHT * edge_score
+
+    # Sky/ground luminance prior: the brighter side of the frame is the top of the scene
+    height, width = gray.shape
+    if axis_score >= 0:
+        luminance_diff = gray[:height // 3].mean() - gray[-(height // 3):].mean()
+        angle = 0 if luminance_diff >= 0 else 180
+    else:
+        # Content lies on its side; a bright left edge means it needs a clockwise quarter turn
+        luminance_diff = gray[:, :width // 3].mean() - gray[:, -(width // 3):].mean()
+        angle = 90 if luminance_diff >= 0 else 270
+
+    axis_confidence = min(1.0, abs(axis_score) / AXIS_SCORE_SCALE)
+    sign_confidence = min(1.0, abs(float(luminance_diff)) / LUMINANCE_DIFF_SCALE)
+    confidence = min(axis_confidence, sign_confidence)
+
+    logger.debug(f"Orientation cues: text={text_score:.2f} edges={edge_score:.2f} luminance={luminance_diff:.3f}")
+    return angle, confidence
+
+def detect_orientation(image_source, remote_detector=None, engine=None, threshold=None):
+    """Orientation engine used in place of the remote call, falling back to it when unsure"""
+    engine = engine or ORIENTATION_ENGINE
+    threshold = ORIENTATION_CONFIDENCE_THRESHOLD if threshold is None else threshold
+
+    if engine == "remote" and remote_detector is not None:
+        return remote_detector(image_source)
+
+    start_time = time.monotonic()
+    try:
+        derivatives = load_derivatives(image_source)
+        angle, confidence = estimate_orientation(derivatives.stage_image("orientation"))
+    except Exception as e:
+        logger.error(f"Local orientation estimate failed: {str(e)}")
+        angle, confidence = 0, 0.0
+    logger.info(f"Local orientation estimate: {angle} degrees (confidence {confidence:.2f}, {(time.monotonic() - start_time) * 1000:.1f} ms)")
+
+    if engine == "hybrid" and confidence < threshold and remote_detector is not None:
+        logger.info("Low orientation confidence, asking the vision model")
+        return remote_detector(image_source)
+    return angle
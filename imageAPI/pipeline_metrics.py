@@ -0,0 +1,103 @@
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+class CaptureMetrics:
+    """Per-capture stage timings and measurements, safe to update from worker threads"""
+
+    def __init__(self):
+        self.stages = {}
+        self.values = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        """Time a block and add it to the named stage"""
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start_time)
+
+    def add(self, name, seconds):
+        """Accumulate seconds spent in a stage (a stage may run more than once)"""
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def set(self, name, value):
+        """Record a measurement that is not a stage duration"""
+        with self._lock:
+            self.values[name] = value
+
+    def add_usage(self, usage):
+        """Accumulate the token counts of an OpenRouter usage block"""
+        if not usage:
+            return
+        with self._lock:
+            for key in ("prompt_tokens", "completion_tokens"):
+                self.values[key] = self.values.get(key, 0) + (usage.get(key) or 0)
+
+    def as_dict(self):
+        with self._lock:
+            return {"stages": dict(self.stages), "values": dict(self.values)}
+
+    def summary(self):
+        """One-line summary for the log"""
+        with self._lock:
+            parts = [f"{name}={seconds * 1000:.0f}ms" for name, seconds in self.stages.items()]
+            parts += [f"{name}={value:.3f}" if isinstance(value, float) else f"{name}={value}"
+                      for name, value in self.values.items()]
+        return " ".join(parts)
+
+# Metrics of the capture currently going through the pipeline
+_current_metrics = CaptureMetrics()
+
+# Background jobs (the offline queue) keep their own metrics per thread
+_thread_metrics = threading.local()
+
+def start_capture():
+    """Begin a fresh set of metrics for a new capture"""
+    global _current_metrics
+    _current_metrics = CaptureMetrics()
+    return _current_metrics
+
+@contextmanager
+def background_capture():
+    """Collect metrics for a capture processed on this thread without touching the live capture"""
+    _thread_metrics.metrics = CaptureMetrics()
+    try:
+        yield _thread_metrics.metrics
+    finally:
+        _thread_metrics.metrics = None
+
+@contextmanager
+def bound(metrics):
+    """Record this thread's stages against an existing capture (pool workers helping with it)"""
+    previous = getattr(_thread_metrics, "metrics", None)
+    _thread_metrics.metrics = metrics
+    try:
+        yield metrics
+    finally:
+        _thread_metrics.metrics = previous
+
+def current():
+    return getattr(_thread_metrics, "metrics", None) or _current_metrics
+
+def stage(name):
+    """Time a block against the current capture"""
+    return current().stage(name)
+
+def record(name, value):
+    """Record a measurement against the current capture"""
+    current().set(name, value)
+
+def add_usage(usage):
+    """Accumulate token usage against the current capture"""
+    current().add_usage(usage)
+
+def add(name, seconds):
+    """Add time measured outside a with-block to a stage of the current capture"""
+    current().add(name, seconds)
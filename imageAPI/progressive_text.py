@@ -0,0 +1,69 @@
+import os
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Maximum LCD refreshes per second while a response is streaming in
+STREAM_RENDER_FPS = float(os.getenv("STREAM_RENDER_FPS", "4"))
+
+def hide_marker(text, marker, final=False):
+    """Drop marker from text; while the text is still growing also hold back a trailing start of it"""
+    text = text.replace(marker, "")
+    if not final:
+        for length in range(min(len(marker) - 1, len(text)), 0, -1):
+            if text.endswith(marker[:length]):
+                return text[:-length]
+    return text
+
+class ProgressiveTextRenderer:
+    """Redraw growing text through render_fn, throttled to a target frame rate
+
+    hidden_marker is a control word the model may append (see hide_marker); it never reaches the screen.
+    """
+
+    def __init__(self, render_fn, fps=STREAM_RENDER_FPS, hidden_marker=None):
+        self.render_fn = render_fn
+        self.frame_interval = 1.0 / fps if fps > 0 else 0.0
+        self.hidden_marker = hidden_marker
+        self.frames_rendered = 0
+        self._last_render = 0.0
+        self._pending_text = None
+
+    def update(self, text):
+        """Queue the latest text and draw it if the frame budget allows"""
+        self._pending_text = text
+        if time.monotonic() - self._last_render >= self.frame_interval:
+            self._render()
+
+    def finish(self):
+        """Draw any text that arrived after the last frame"""
+        if self._pending_text is not None:
+            self._render(final=True)
+
+    def _render(self, final=False):
+        text = self._pending_text
+        if self.hidden_marker:
+            text = hide_marker(text, self.hidden_marker, final)
+        self.render_fn(text)
+        self._pending_text = None
+        self._last_render = time.monotonic()
+        self.frames_rendered += 1
+
+def stream_to_display(deltas, renderer, label="response", start_time=None):
+    """Accumulate streamed text deltas into the renderer, returns (text, time to first text)"""
+    # start_time lets callers that opened the stream earlier count that wait too
+    start_time = time.monotonic() if start_time is None else start_time
+    first_text_time = None
+    parts = []
+    for delta in deltas:
+        if first_text_time is None:
+            first_text_time = time.monotonic() - start_time
+            logger.info(f"Time to first text ({label}): {first_text_time * 1000:.0f} ms")
+        parts.append(delta)
+        renderer.update("".join(parts))
+    renderer.finish()
+
+    total_time = time.monotonic() - start_time
+    logger.info(f"Streamed {label} in {total_time * 1000:.0f} ms over {renderer.frames_rendered} LCD frames")
+    return "".join(parts), first_text_time
@@ -0,0 +1,89 @@
+import re
+import json
+import time
+import uuid
+
+class InlineImage:
+    """Base64 image for a data URL, kept as bytes until the request body is assembled"""
+
+    def __init__(self, base64_bytes, mime_type="image/jpeg"):
+        self.base64_bytes = base64_bytes
+        self.mime_type = mime_type
+
+    def __str__(self):
+        # Only for logging and debugging, the body never goes through a str copy
+        return f"data:{self.mime_type};base64,<{len(self.base64_bytes)} bytes>"
+
+class TimedBody:
+    """Request body that notes how long the HTTP library takes to write it to the socket
+
+    The library asks for the next block only once the previous one is sent, so the empty
+    read at the end comes after the whole body went out. Unlike the time to the response
+    headers this leaves out connecting and the server's queueing, prefill and generation.
+    Bytes still unsent in the socket buffer (kept small with TCP_NOTSENT_LOWAT) or in flight
+    within the congestion window are not counted, so the smallest bodies read fast.
+    """
+
+    def __init__(self, body):
+        self._view = memoryview(body)
+        self._position = 0
+        self.started = None
+        self.finished = None
+
+    def __len__(self):
+        return len(self._view)
+
+    def read(self, size=-1):
+        now = time.monotonic()
+        if self.started is None:
+            self.started = now
+        if size is None or size < 0:
+            size = len(self._view) - self._position
+        block = self._view[self._position:self._position + size]
+        self._position += len(block)
+        if not block and self.finished is None:
+            self.finished = now
+        return bytes(block)
+
+    def blocks(self, size=16384):
+        """The body as an iterator of blocks, for clients that take an iterable (httpx)"""
+        while True:
+            block = self.read(size)
+            if not block:
+                return
+            yield block
+
+    def seconds(self):
+        """Time from the first block to the end of the body, None if it was not sent in full"""
+        if self.started is None or self.finished is None:
+            return None
+        return self.finished - self.started
+
+def encode_json_body(payload):
+    """Serialize a chat-completion payload to bytes, splicing in InlineImage data with one join
+
+    json.dumps only sees a short placeholder per image, so the base64 data is copied
+    exactly once (into the final body) instead of through str, f-string and dumps copies.
+    """
+    nonce = uuid.uuid4().hex
+    images = []
+
+    def placeholder(value):
+        if isinstance(value, InlineImage):
+            images.append(value)
+            return f"@@image-{nonce}-{len(images) - 1}@@"
+        raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+    body = json.dumps(payload, default=placeholder).encode("utf-8")
+    if not images:
+        return body
+
+    # Base64 is JSON-safe, so the data goes into the string literal as is
+    pieces = re.split(f"@@image-{nonce}-(\\d+)@@".encode("ascii"), body)
+    parts = [pieces[0]]
+    for index, text in zip(pieces[1::2], pieces[2::2]):
+        image = images[int(index)]
+        parts.append(f"data:{image.mime_type};base64,".encode("ascii"))
+        parts.append(image.base64_bytes)
+        parts.append(text)
+    return b"".join(parts)
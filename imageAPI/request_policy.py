@@ -0,0 +1,138 @@
+import os
+import time
+import random
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+
+logger = logging.getLogger(__name__)
+
+# Overall time budget for one capture, shared by every stage (seconds)
+CAPTURE_DEADLINE = float(os.getenv("CAPTURE_DEADLINE", "60"))
+
+# Per-stage connect and read timeouts (seconds). REQUEST_CONNECT_TIMEOUT covers stages without their own;
+# orientation falls back to the local estimate, so it gives up just after the first SYN retransmit
+REQUEST_CONNECT_TIMEOUT = float(os.getenv("REQUEST_CONNECT_TIMEOUT", "3.05"))
+STAGE_CONNECT_TIMEOUTS = {
+    "orientation": float(os.getenv("ORIENTATION_CONNECT_TIMEOUT", "1.05")),
+    "analysis": float(os.getenv("ANALYSIS_CONNECT_TIMEOUT", str(REQUEST_CONNECT_TIMEOUT))),
+    "description": float(os.getenv("DESCRIPTION_CONNECT_TIMEOUT", str(REQUEST_CONNECT_TIMEOUT))),
+    "fast": float(os.getenv("FAST_CONNECT_TIMEOUT", str(REQUEST_CONNECT_TIMEOUT)))
+}
+STAGE_READ_TIMEOUTS = {
+    "orientation": float(os.getenv("ORIENTATION_READ_TIMEOUT", "10")),
+    "analysis": float(os.getenv("ANALYSIS_READ_TIMEOUT", "30")),
+    "description": float(os.getenv("DESCRIPTION_READ_TIMEOUT", "20")),
+    "fast": float(os.getenv("FAST_READ_TIMEOUT", "30"))
+}
+DEFAULT_READ_TIMEOUT = 30.0
+
+# Retries with exponential backoff and full jitter
+REQUEST_MAX_RETRIES = int(os.getenv("REQUEST_MAX_RETRIES", "2"))
+BACKOFF_BASE = float(os.getenv("REQUEST_BACKOFF_BASE", "0.5"))
+BACKOFF_MAX = float(os.getenv("REQUEST_BACKOFF_MAX", "8"))
+
+# Responses worth retrying: rate limiting and transient upstream failures
+RETRYABLE_STATUS_CODES = (408, 429, 500, 502, 503, 504)
+
+class DeadlineExceeded(Exception):
+    """The capture ran out of its time budget"""
+
+class Deadline:
+    """Absolute end time for a capture, shared by all of its stages"""
+
+    def __init__(self, seconds=CAPTURE_DEADLINE):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def check(self, stage):
+        """Raise if there is no time left to start a stage"""
+        if self.expired():
+            raise DeadlineExceeded(f"Capture deadline exceeded before {stage}")
+
+class RequestCancelled(Exception):
+    """The caller gave up on the request while it was in flight (a hedge that lost)"""
+
+class CancelEvent(threading.Event):
+    """Event that also runs callbacks when set, so an in-flight request can be aborted at once"""
+
+    def __init__(self):
+        super().__init__()
+        self._callbacks = []
+        self._callback_lock = threading.Lock()
+
+    def add_callback(self, callback):
+        """Run callback when the event is set, straight away if it already is"""
+        with self._callback_lock:
+            if not self.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def remove_callback(self, callback):
+        with self._callback_lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def set(self):
+        with self._callback_lock:
+            super().set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.debug(f"Cancel callback failed: {e}")
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date), or None"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class RequestPolicy:
+    """Timeouts and retry decisions shared by every OpenRouter request"""
+
+    def __init__(self, connect_timeout=REQUEST_CONNECT_TIMEOUT, read_timeouts=None, connect_timeouts=None,
+                 max_retries=REQUEST_MAX_RETRIES, backoff_base=BACKOFF_BASE, backoff_max=BACKOFF_MAX):
+        self.connect_timeout = connect_timeout
+        self.connect_timeouts = connect_timeouts or STAGE_CONNECT_TIMEOUTS
+        self.read_timeouts = read_timeouts or STAGE_READ_TIMEOUTS
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    def timeout(self, stage=None, deadline=None):
+        """(connect, read) timeouts for a stage, shortened to what is left of the deadline"""
+        connect_timeout = self.connect_timeouts.get(stage, self.connect_timeout)
+        read_timeout = self.read_timeouts.get(stage, DEFAULT_READ_TIMEOUT)
+        if deadline is not None:
+            deadline.check(stage or "request")
+            remaining = deadline.remaining()
+            connect_timeout = min(connect_timeout, remaining)
+            read_timeout = min(read_timeout, remaining)
+        return connect_timeout, read_timeout
+
+    def next_delay(self, attempt, deadline=None, retry_after=None):
+        """Seconds to sleep before retry number attempt + 1, or None to give up"""
+        if attempt >= self.max_retries:
+            return None
+        delay = parse_retry_after(retry_after)
+        if delay is None:
+            # Full jitter keeps devices that failed together from retrying together
+            delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        if deadline is not None and delay >= deadline.remaining():
+            return None
+        return delay
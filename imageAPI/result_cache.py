@@ -0,0 +1,152 @@
+import os
+import time
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Cache settings (overridable from the .env file)
+# Off by default: two different products shot on the same background can land within the
+# threshold, and a false hit shows the previous product's description without any request
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE", "0") == "1"
+RESULT_CACHE_HASH = os.getenv("RESULT_CACHE_HASH", "dhash")
+RESULT_CACHE_THRESHOLD = int(os.getenv("RESULT_CACHE_THRESHOLD", "4"))
+RESULT_CACHE_MEMORY_SIZE = int(os.getenv("RESULT_CACHE_MEMORY_SIZE", "64"))
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "2000"))
+RESULT_CACHE_MAX_AGE = float(os.getenv("RESULT_CACHE_MAX_AGE", str(24 * 3600)))
+
+HASH_SIZE = 8
+PHASH_SIZE = 32
+
+def _bits_to_int(bits):
+    return int("".join("1" if bit else "0" for bit in bits.flatten()), 2)
+
+def dhash(image):
+    """64-bit difference hash: brightness gradient between horizontally adjacent cells"""
+    gray = np.asarray(image.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.BILINEAR), dtype=np.int16)
+    return _bits_to_int(gray[:, 1:] > gray[:, :-1])
+
+def _dct_matrix(size):
+    """Orthonormal DCT-II basis, so a 2-D DCT is C @ X @ C.T"""
+    k = np.arange(size)[:, None]
+    n = np.arange(size)[None, :]
+    matrix = np.cos(np.pi * (2 * n + 1) * k / (2 * size)) * np.sqrt(2.0 / size)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix
+
+_PHASH_DCT = _dct_matrix(PHASH_SIZE)
+
+def phash(image):
+    """64-bit DCT hash: low-frequency coefficients compared to their median"""
+    gray = np.asarray(image.convert("L").resize((PHASH_SIZE, PHASH_SIZE), Image.BILINEAR), dtype=np.float32)
+    low_freq = (_PHASH_DCT @ gray @ _PHASH_DCT.T)[:HASH_SIZE, :HASH_SIZE]
+    return _bits_to_int(low_freq > np.median(low_freq[1:, 1:]))
+
+def perceptual_hash(image, method=RESULT_CACHE_HASH):
+    return phash(image) if method == "phash" else dhash(image)
+
+def hamming_distance(hash_a, hash_b):
+    return bin(hash_a ^ hash_b).count("1")
+
+class ResultCache:
+    """Description cache keyed on perceptual hashes: in-memory LRU in front of SQLite"""
+
+    def __init__(self, db_path, threshold=RESULT_CACHE_THRESHOLD, memory_size=RESULT_CACHE_MEMORY_SIZE,
+                 max_entries=RESULT_CACHE_MAX_ENTRIES, max_age=RESULT_CACHE_MAX_AGE):
+        self.threshold = threshold
+        self.memory_size = memory_size
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._memory = OrderedDict()  # hash -> (description, created_at)
+        self._lock = threading.Lock()
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS results (
+                hash TEXT PRIMARY KEY,
+                description TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self._db.commit()
+
+    def _nearest(self, frame_hash, candidates):
+        """Closest (hash, value) within the Hamming threshold, or None"""
+        best = None
+        for candidate_hash, value in candidates:
+            distance = hamming_distance(frame_hash, candidate_hash)
+            if distance <= self.threshold and (best is None or distance < best[0]):
+                best = (distance, candidate_hash, value)
+        return best
+
+    def lookup(self, frame_hash):
+        """Return the cached description for a near-identical frame, or None"""
+        now = time.time()
+        with self._lock:
+            # In-memory LRU first
+            match = self._nearest(frame_hash, self._memory.items())
+            if match and now - match[2][1] <= self.max_age:
+                distance, cached_hash, (description, _) = match
+                self._memory.move_to_end(cached_hash)
+            else:
+                # Fall back to the on-disk store
+                rows = self._db.execute("SELECT hash, description, created_at FROM results WHERE created_at >= ?",
+                                        (now - self.max_age,)).fetchall()
+                match = self._nearest(frame_hash, ((int(row[0], 16), (row[1], row[2])) for row in rows))
+                if match is None:
+                    self.misses += 1
+                    logger.info(f"Result cache miss (hits={self.hits} misses={self.misses} evictions={self.evictions})")
+                    return None
+                distance, cached_hash, (description, created_at) = match
+                self._remember(cached_hash, description, created_at)
+
+            self._db.execute("UPDATE results SET last_used = ? WHERE hash = ?", (now, f"{cached_hash:016x}"))
+            self._db.commit()
+            self.hits += 1
+            logger.info(f"Result cache hit at distance {distance} (hits={self.hits} misses={self.misses} evictions={self.evictions})")
+            return description
+
+    def store(self, frame_hash, description):
+        """Cache a description and evict stale or excess entries"""
+        now = time.time()
+        with self._lock:
+            self._remember(frame_hash, description, now)
+            self._db.execute("INSERT OR REPLACE INTO results (hash, description, created_at, last_used) VALUES (?, ?, ?, ?)",
+                             (f"{frame_hash:016x}", description, now, now))
+
+            # Age-based eviction, then size-based eviction of the least recently used
+            stale = self._db.execute("""
+                SELECT hash FROM results WHERE created_at < ?
+                UNION
+                SELECT hash FROM (SELECT hash FROM results ORDER BY last_used DESC LIMIT -1 OFFSET ?)
+            """, (now - self.max_age, self.max_entries)).fetchall()
+            self._db.executemany("DELETE FROM results WHERE hash = ?", stale)
+            self._db.commit()
+            # Evicted entries must not live on in memory either
+            for (stale_hash,) in stale:
+                self._memory.pop(int(stale_hash, 16), None)
+            if stale:
+                self.evictions += len(stale)
+                logger.info(f"Result cache evicted {len(stale)} entries (evictions={self.evictions})")
+
+    def _remember(self, frame_hash, description, created_at):
+        self._memory[frame_hash] = (description, created_at)
+        self._memory.move_to_end(frame_hash)
+        while len(self._memory) > self.memory_size:
+            # Dropped from memory only, the entry is still on disk
+            self._memory.popitem(last=False)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
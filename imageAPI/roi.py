@@ -0,0 +1,65 @@
+import os
+import numpy as np
+
+# Region-of-interest cropping of the analysis upload (overridable from the .env file)
+ROI_CROP = os.getenv("ROI_CROP", "1") == "1"
+# Below this confidence the full frame is uploaded
+ROI_MIN_CONFIDENCE = float(os.getenv("ROI_MIN_CONFIDENCE", "0.35"))
+# Margin added on each side of the box, as a fraction of its width or height
+ROI_MARGIN = float(os.getenv("ROI_MARGIN", "0.15"))
+# Crops keeping more than this share of the frame save too little to be worth the risk
+ROI_MAX_AREA = float(os.getenv("ROI_MAX_AREA", "0.8"))
+# Anything smaller is more likely a speck than the subject
+ROI_MIN_AREA = 0.02
+# Share of the edge energy (per axis) the box must contain
+ROI_ENERGY = 0.9
+
+class RegionOfInterest:
+    """Subject box as fractions of the frame (left, top, right, bottom), margin included"""
+
+    def __init__(self, box, confidence):
+        self.box = box
+        self.confidence = confidence
+
+    @property
+    def area(self):
+        left, top, right, bottom = self.box
+        return (right - left) * (bottom - top)
+
+    def usable(self):
+        return self.confidence >= ROI_MIN_CONFIDENCE and ROI_MIN_AREA <= self.area <= ROI_MAX_AREA
+
+    def __str__(self):
+        left, top, right, bottom = self.box
+        return (f"box ({left:.2f}, {top:.2f})-({right:.2f}, {bottom:.2f}), {self.area:.0%} of the frame, "
+                f"confidence {self.confidence:.2f}")
+
+def estimate_roi(image):
+    """Find the subject from edge density on a small derivative, None for a featureless frame
+
+    Background (walls, tables, sky) is smooth, so the box that holds most of the strong
+    gradients is taken as the subject. Confidence is the share of edge energy inside the
+    box minus the share of the frame it covers: high for a compact subject, near zero
+    when edges are spread everywhere.
+    """
+    luma = np.asarray(image.convert("L"), dtype=np.float32)
+    energy = np.abs(np.diff(luma, axis=1))[:-1, :] + np.abs(np.diff(luma, axis=0))[:, :-1]
+    # Drop sensor noise and soft texture, keep real edges
+    energy[energy < energy.mean() + energy.std()] = 0
+    total = energy.sum()
+    if total == 0:
+        return None
+
+    height, width = energy.shape
+    tail = (1 - ROI_ENERGY) / 2
+    left, right = np.searchsorted(np.cumsum(energy.sum(axis=0)) / total, [tail, 1 - tail])
+    top, bottom = np.searchsorted(np.cumsum(energy.sum(axis=1)) / total, [tail, 1 - tail])
+    right, bottom = min(right + 1, width), min(bottom + 1, height)
+    inside = energy[top:bottom, left:right].sum() / total
+    confidence = float(inside - (right - left) * (bottom - top) / (width * height))
+
+    margin_x = (right - left) * ROI_MARGIN
+    margin_y = (bottom - top) * ROI_MARGIN
+    box = (max(0.0, (left - margin_x) / width), max(0.0, (top - margin_y) / height),
+           min(1.0, (right + margin_x) / width), min(1.0, (bottom + margin_y) / height))
+    return RegionOfInterest(box, confidence)
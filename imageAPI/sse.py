@@ -0,0 +1,56 @@
+import json
+
+class SSEParser:
+    """Incremental server-sent-events parser fed with raw network chunks"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._data_lines = []
+
+    def feed(self, chunk):
+        """Consume a chunk of bytes and return the data payloads of every completed event"""
+        self._buffer.extend(chunk)
+        events = []
+        while True:
+            newline_index = self._buffer.find(b"\n")
+            if newline_index < 0:
+                break
+            # Lines are only decoded once complete, so split UTF-8 sequences are safe
+            line = bytes(self._buffer[:newline_index]).rstrip(b"\r")
+            del self._buffer[:newline_index + 1]
+
+            if not line:
+                # A blank line terminates the event
+                if self._data_lines:
+                    events.append("\n".join(self._data_lines))
+                    self._data_lines = []
+            elif line.startswith(b":"):
+                # Comment line, OpenRouter sends these as processing keep-alives
+                continue
+            else:
+                field, _, value = line.partition(b":")
+                if value.startswith(b" "):
+                    value = value[1:]
+                if field == b"data":
+                    self._data_lines.append(value.decode("utf-8"))
+        return events
+
+def iter_completion_deltas(chunks, error_class=RuntimeError, on_usage=None):
+    """Turn a stream of chat-completion SSE chunks into text deltas"""
+    parser = SSEParser()
+    for chunk in chunks:
+        for event_data in parser.feed(chunk):
+            if event_data == "[DONE]":
+                return
+            event = json.loads(event_data)
+            if "error" in event:
+                error = event["error"]
+                raise error_class(error.get("code"), error.get("message", ""))
+            if event.get("usage") and on_usage is not None:
+                # The final chunk carries the token counts of the whole completion
+                on_usage(event["usage"])
+            choices = event.get("choices") or []
+            if choices:
+                content = (choices[0].get("delta") or {}).get("content")
+                if content:
+                    yield content
@@ -0,0 +1,205 @@
+import io
+import os
+import time
+import logging
+import threading
+from collections import deque
+import numpy as np
+from PIL import features
+
+from latency_stats import RollingLatency
+
+logger = logging.getLogger(__name__)
+
+# Upload codec: jpeg, webp, avif, or auto to pick whichever minimises encode plus transfer time
+# on the measured link; models only get codecs they accept (overridable from the .env file)
+UPLOAD_CODEC = os.getenv("UPLOAD_CODEC", "jpeg")
+# Encodes measured per codec before auto trusts its numbers
+CODEC_MIN_SAMPLES = int(os.getenv("CODEC_MIN_SAMPLES", "3"))
+
+# Adaptive upload encoding
+ADAPTIVE_UPLOAD = os.getenv("ADAPTIVE_UPLOAD", "1") == "1"
+# Seconds the image of one upload should take on the measured uplink
+UPLOAD_TARGET_SECONDS = float(os.getenv("UPLOAD_TARGET_SECONDS", "0.5"))
+# Encodes tried per upload before settling for the smallest one
+UPLOAD_MAX_ATTEMPTS = int(os.getenv("UPLOAD_MAX_ATTEMPTS", "5"))
+UPLOAD_MIN_QUALITY = int(os.getenv("UPLOAD_MIN_QUALITY", "40"))
+UPLOAD_MIN_LONG_EDGE = int(os.getenv("UPLOAD_MIN_LONG_EDGE", "384"))
+# Drop colour before resolution when the budget is tight (labels and other text-heavy scenes)
+UPLOAD_GRAYSCALE = os.getenv("UPLOAD_GRAYSCALE", "0") == "1"
+# Requests kept for the bandwidth fit, and how many it needs
+BANDWIDTH_WINDOW = int(os.getenv("BANDWIDTH_WINDOW", "20"))
+BANDWIDTH_MIN_SAMPLES = int(os.getenv("BANDWIDTH_MIN_SAMPLES", "4"))
+# Smallest spread of request sizes (bytes) the fit can separate bandwidth from fixed costs with
+BANDWIDTH_MIN_SPREAD = 10000
+
+# Encoder options favour speed on the Pi's CPU over the last few percent of size
+CODECS = {
+    "jpeg": {"format": "JPEG", "mime_type": "image/jpeg", "options": {}},
+    "webp": {"format": "WEBP", "mime_type": "image/webp", "options": {"method": 2}},
+    "avif": {"format": "AVIF", "mime_type": "image/avif", "options": {"speed": 8}}
+}
+
+def available_codecs():
+    """Codecs this Pillow build can encode, JPEG always first"""
+    codecs = ["jpeg"]
+    for codec in ("webp", "avif"):
+        try:
+            if features.check(codec):
+                codecs.append(codec)
+        except ValueError:
+            # Pillow versions that predate the feature
+            continue
+    return codecs
+
+class CodecStats:
+    """Rolling encode seconds and bytes per pixel of each codec at the stage qualities"""
+
+    def __init__(self, window=BANDWIDTH_WINDOW):
+        self.window = window
+        self._seconds = {}
+        self._bytes = {}
+        self._lock = threading.Lock()
+
+    def record(self, codec, pixels, seconds, size):
+        with self._lock:
+            self._seconds.setdefault(codec, RollingLatency(self.window)).add(seconds / pixels)
+            self._bytes.setdefault(codec, RollingLatency(self.window)).add(size / pixels)
+
+    def samples(self, codec):
+        with self._lock:
+            return len(self._seconds.get(codec, ()))
+
+    def cost(self, codec, pixels, bytes_per_second=None):
+        """Expected encode seconds, plus upload seconds when the bandwidth is known"""
+        with self._lock:
+            seconds = self._seconds[codec].percentile(50) * pixels
+            size = self._bytes[codec].percentile(50) * pixels
+        if bytes_per_second:
+            # Base64 turns 3 bytes into 4 on the wire
+            seconds += size * 4 / 3 / bytes_per_second
+        return seconds
+
+class BandwidthEstimator:
+    """Uplink estimate from the body size and body write time of recent requests
+
+    A least-squares line through (bytes, seconds) gives the per-byte cost (the slope) apart
+    from the fixed per-request cost such as TCP slow start (the intercept).
+    """
+
+    def __init__(self, window=BANDWIDTH_WINDOW):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, body_bytes, seconds):
+        with self._lock:
+            self._samples.append((body_bytes, seconds))
+
+    def estimate(self):
+        """(bytes per second, fixed seconds per request), or None until the fit is meaningful"""
+        with self._lock:
+            if len(self._samples) < BANDWIDTH_MIN_SAMPLES:
+                return None
+            sizes, seconds = np.array(self._samples, dtype=np.float64).T
+        if np.ptp(sizes) < BANDWIDTH_MIN_SPREAD:
+            return None
+        slope, intercept = np.polyfit(sizes, seconds, 1)
+        if slope <= 0:
+            # Too fast to tell apart from the noise
+            return None
+        return 1.0 / slope, max(0.0, intercept)
+
+    def byte_budget(self, target_seconds=UPLOAD_TARGET_SECONDS):
+        """JPEG bytes that upload within target_seconds, None when there is no estimate"""
+        estimate = self.estimate()
+        if estimate is None:
+            return None
+        # Base64 turns 3 bytes into 4 on the wire
+        return int(target_seconds * estimate[0] * 3 / 4)
+
+# Fed by the OpenRouter client and the encoders, read by every encoder
+upload_bandwidth = BandwidthEstimator()
+codec_stats = CodecStats()
+
+def choose_codec(accepted=("jpeg",), pixels=1, codec=None):
+    """Codec for an upload of this many pixels to models that accept the given codecs"""
+    codec = codec or UPLOAD_CODEC
+    candidates = [name for name in available_codecs() if name in accepted] or ["jpeg"]
+    if codec != "auto":
+        return codec if codec in candidates else "jpeg"
+    if len(candidates) == 1:
+        return candidates[0]
+    # Measure every codec a few times before comparing them
+    for name in candidates:
+        if codec_stats.samples(name) < CODEC_MIN_SAMPLES:
+            return name
+    # Without a bandwidth estimate the link is fast (or unmeasured) and encode time decides
+    estimate = upload_bandwidth.estimate()
+    bytes_per_second = estimate[0] if estimate else None
+    return min(candidates, key=lambda name: codec_stats.cost(name, pixels, bytes_per_second))
+
+def byte_budget():
+    if not ADAPTIVE_UPLOAD:
+        return None
+    return upload_bandwidth.byte_budget()
+
+def encode(image, quality, codec="jpeg", record=False):
+    """Encode with one of CODECS; record adds the timing to codec_stats (stage qualities only)"""
+    settings = CODECS[codec]
+    start_time = time.perf_counter()
+    buffer = io.BytesIO()
+    image.save(buffer, format=settings["format"], quality=quality, **settings["options"])
+    encoded = buffer.getbuffer()
+    if record:
+        codec_stats.record(codec, image.size[0] * image.size[1], time.perf_counter() - start_time, len(encoded))
+    return encoded
+
+def _shrink(image, scale):
+    long_edge = max(UPLOAD_MIN_LONG_EDGE, int(max(image.size) * scale))
+    if long_edge >= max(image.size):
+        return image
+    ratio = long_edge / max(image.size)
+    return image.resize((max(1, round(image.size[0] * ratio)), max(1, round(image.size[1] * ratio))))
+
+def encode_for_budget(image, quality, budget, codec="jpeg", grayscale=UPLOAD_GRAYSCALE,
+                      max_attempts=UPLOAD_MAX_ATTEMPTS):
+    """Encode image within budget bytes using at most max_attempts encodes
+
+    The stage's own quality is tried first, so nothing changes on a fast link. Otherwise
+    quality is searched between UPLOAD_MIN_QUALITY and it, and only when even the lowest
+    quality is too big does the image lose colour (if allowed) and then resolution.
+    Returns the encoded image and a short description of what was used.
+    """
+    attempts = 1
+    encoded = encode(image, quality, codec, record=True)
+    if len(encoded) <= budget or max_attempts <= 1:
+        return encoded, f"q{quality}"
+
+    attempts += 1
+    smallest = encode(image, UPLOAD_MIN_QUALITY, codec)
+    used = f"q{UPLOAD_MIN_QUALITY}"
+    if len(smallest) <= budget:
+        # Binary search for the highest quality that still fits
+        low, high = UPLOAD_MIN_QUALITY, quality
+        while attempts < max_attempts and high - low > 1:
+            middle = (low + high) // 2
+            attempts += 1
+            candidate = encode(image, middle, codec)
+            if len(candidate) <= budget:
+                smallest, used, low = candidate, f"q{middle}", middle
+            else:
+                high = middle
+        return smallest, used
+
+    if grayscale and image.mode != "L" and attempts < max_attempts:
+        image = image.convert("L")
+        attempts += 1
+        smallest = encode(image, UPLOAD_MIN_QUALITY, codec)
+        used = f"gray q{UPLOAD_MIN_QUALITY}"
+    while len(smallest) > budget and attempts < max_attempts and max(image.size) > UPLOAD_MIN_LONG_EDGE:
+        # JPEG size roughly follows the pixel count; aim a little under the budget
+        image = _shrink(image, (budget / len(smallest)) ** 0.5 * 0.9)
+        attempts += 1
+        smallest = encode(image, UPLOAD_MIN_QUALITY, codec)
+        used = f"{'gray ' if image.mode == 'L' else ''}q{UPLOAD_MIN_QUALITY} {image.size[0]}x{image.size[1]}"
+    return smallest, used